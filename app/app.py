@@ -1,25 +1,65 @@
+import os
 from flask import Flask
 from flasgger import Swagger
 from flask_caching import Cache
-from models import db
-from config import Config
+from models import db, ensure_schema
+from config import CONFIGS
 from routes import register_routes
+from decryption import decryptor
+from storage import create_store, init_storage
+from metrics import metrics
+from cli import his
+from catalogue import ensure_program_search
+from profile_cache import profile_cache
+from batching import write_batcher
+from serialization import FastJSONProvider, init_compression
+from sharding import shards
+from tokens import api_tokens
 
-def create_app():
+def create_app(config=None):
+    """
+    Args:
+        config: A config class, or a name from config.CONFIGS. Defaults to
+            the HIS_CONFIG environment variable, then 'default'.
+    """
     app = Flask(__name__)
-    app.config.from_object(Config)
+    config = config or os.environ.get('HIS_CONFIG', 'default')
+    app.config.from_object(CONFIGS[config] if isinstance(config, str) else config)
+    app.json = FastJSONProvider(app)
     
     # Initialize extensions
+    shards.configure(app)
     db.init_app(app)
+    shards.init_app(app, db)
     cache = Cache(app)
+    decryptor.init_app(app)
+    profile_cache.init_app(app, cache)
+    write_batcher.init_app(app)
+    api_tokens.init_app(app)
+    metrics.register_cache('profile', profile_cache.stats)
+    metrics.register_cache('decrypt', decryptor.stats)
+    metrics.register_cache('auth', api_tokens.stats)
     Swagger(app)
     
     # Register routes
-    register_routes(app, cache)
+    store = app.extensions['his_store'] = create_store(app, cache)
+    register_routes(app, store)
+    app.cli.add_command(his)
     
     # Create database tables
     with app.app_context():
+        init_storage(app)
+        metrics.init_app(app)
         db.create_all()
+        ensure_schema()
+        for shard in range(1, shards.count):
+            ensure_schema(shards.engine(shard), shards.local_tables())
+        if shards.enabled:
+            shards.sync_replicas()
+        ensure_program_search()
+
+    # Registered after metrics so it runs first and metrics count compressed bytes
+    init_compression(app)
     
     return app
 
@@ -0,0 +1,250 @@
+"""
+ASGI entry point. Client listing, search and profile reads and the /changes
+long poll are served natively on an async SQLAlchemy engine (aiosqlite), with
+Fernet work on a bounded thread pool; every other request is handed to the
+Flask app on a pool of its own.
+
+    uvicorn asgi:app --app-dir app
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qsl, urlencode
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import create_app
+from models import db, Client
+from changes import (
+    ARGS_ERROR, POLL_INTERVAL, change_query, format_cursor, merge_changes, parse_changes_args
+)
+from clients import STREAM_BATCH_SIZE, client_listing, serialize_clients, split_page
+from pagination import page_limit
+from profile_cache import profile_cache
+from profiles import collect_profiles, decrypt_profiles, profile_etag, profile_query
+from serialization import dumps
+from storage import install_pragmas
+from tokens import api_tokens, hash_token
+
+UNAUTHORIZED_HEADERS = [(b'www-authenticate', b'Bearer realm="Authentication Required"')]
+# The synchronous body of WsgiToAsgiInstance.run_wsgi_app, which asgiref
+# wraps for its single shared thread
+RUN_WSGI_APP = vars(WsgiToAsgiInstance)['run_wsgi_app'].func
+# GET /clients/<name> paths that are other routes, not client ids
+CLIENT_ROUTES = {'search', 'bulk', 'profiles'}
+
+def header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+def etag_matches(if_none_match, etag):
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """
+    WsgiToAsgi that runs the WSGI app on the given executor. asgiref's default
+    runs every request on one shared thread, so a slow request would hold up
+    all the others.
+    """
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        instance = WsgiToAsgiInstance(self.wsgi_application, self.duplicate_header_limit)
+        instance.run_wsgi_app = sync_to_async(
+            partial(RUN_WSGI_APP, instance),
+            thread_sensitive=False, executor=self.executor
+        )
+        await instance(scope, receive, send)
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        self.wsgi_pool = ThreadPoolExecutor(max_workers=config['WSGI_WORKERS'],
+                                            thread_name_prefix='wsgi')
+        self.wsgi = PooledWsgiToAsgi(flask_app, self.wsgi_pool)
+        with flask_app.app_context():
+            url = db.engine.url
+        self.engine = None
+        # Sharded deployments fan reads out across databases, and the memory
+        # store lives in the Flask app, so only the Flask app serves those
+        if (url.get_backend_name() == 'sqlite' and config.get('SHARD_COUNT', 1) == 1
+                and config.get('STORAGE_BACKEND', 'sql') == 'sql'):
+            self.engine = create_async_engine(
+                url.set(drivername='sqlite+aiosqlite'), **config.get('ASYNC_ENGINE_OPTIONS', {})
+            )
+            install_pragmas(self.engine.sync_engine, config.get('SQLITE_PRAGMAS'))
+        self.crypto = ThreadPoolExecutor(max_workers=config['CRYPTO_WORKERS'],
+                                         thread_name_prefix='crypto')
+        self.max_concurrency = config['ASYNC_MAX_CONCURRENCY']
+        self.slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return await self.wsgi(scope, receive, send)
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_concurrency)
+        async with self.slots:
+            handler, args = self.route(scope)
+            if handler is None:
+                return await self.wsgi(scope, receive, send)
+            if not await self.authorized(scope):
+                return await self.respond(send, 401, b'Unauthorized Access', 'text/plain',
+                                          UNAUTHORIZED_HEADERS)
+            await handler(scope, send, *args)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                self.crypto.shutdown(wait=False)
+                self.wsgi_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def route(self, scope):
+        if self.engine is None or scope['method'] != 'GET':
+            return None, ()
+        parts = scope['path'].strip('/').split('/')
+        if parts == ['clients']:
+            return self.list_clients, ('',)
+        if parts == ['clients', 'search']:
+            return self.list_clients, (None,)
+        if len(parts) == 2 and parts[0] == 'clients' and parts[1] and parts[1] not in CLIENT_ROUTES:
+            return self.client_profile, (parts[1],)
+        if parts == ['changes']:
+            return self.changes, ()
+        return None, ()
+
+    async def authorized(self, scope):
+        scheme, _, token = (header(scope, b'authorization') or '').partition(' ')
+        token = token.strip()
+        if scheme.lower() != 'bearer' or not token:
+            return False
+        digest = hash_token(token)
+        if api_tokens.cached(digest) is not None:
+            return True
+        # Cache miss: the database lookup blocks, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.load_principal, digest) is not None
+
+    def load_principal(self, digest):
+        with self.flask_app.app_context():
+            return api_tokens.load(digest)
+
+    async def respond(self, send, status, body, content_type='application/json', headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type.encode()),
+                        (b'content-length', str(len(body)).encode()), *headers]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def respond_json(self, send, status, data, headers=()):
+        await self.respond(send, status, dumps(data), headers=headers)
+
+    async def list_clients(self, scope, send, name):
+        args = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        try:
+            query = client_listing(args.get('name', '') if name is None else name, args.get('cursor'))
+            limit = page_limit(args)
+        except ValueError as e:
+            return await self.respond_json(send, 400, {'error': str(e)})
+
+        loop = asyncio.get_running_loop()
+        if args.get('format') == 'ndjson':
+            return await self.stream_clients(send, query, loop)
+
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(query.limit(limit + 1))).all()
+        rows, next_cursor = split_page(rows, limit)
+        results = await loop.run_in_executor(self.crypto, serialize_clients, rows)
+        headers = []
+        if next_cursor:
+            link = f'<{scope["path"]}?{urlencode(dict(args, cursor=next_cursor))}>; rel="next"'
+            headers = [(b'x-next-cursor', next_cursor.encode()), (b'link', link.encode())]
+        await self.respond_json(send, 200, results, headers)
+
+    async def stream_clients(self, send, query, loop):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/x-ndjson')]
+        })
+        async with self.engine.connect() as conn:
+            result = await conn.stream(query)
+            async for rows in result.partitions(STREAM_BATCH_SIZE):
+                clients = await loop.run_in_executor(self.crypto, serialize_clients, rows)
+                body = b''.join(dumps(client) + b'\n' for client in clients)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def changes(self, scope, send):
+        args = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        try:
+            positions, limit, wait = parse_changes_args(args)
+        except ValueError:
+            return await self.respond_json(send, 400, {'error': ARGS_ERROR})
+        # As wait_for_changes(), but the poll sleeps without holding a thread
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(change_query(positions[0], limit))).all()
+            if rows or loop.time() >= deadline:
+                break
+            await asyncio.sleep(POLL_INTERVAL)
+        changes, positions = merge_changes([[(0, row) for row in rows]], positions, limit)
+        await self.respond_json(send, 200, {'changes': changes, 'next': format_cursor(positions)})
+
+    async def client_profile(self, scope, send, client_id):
+        if_none_match = header(scope, b'if-none-match')
+        if if_none_match:
+            async with self.engine.connect() as conn:
+                version = (await conn.execute(
+                    select(Client.version).where(Client.id == client_id)
+                )).scalar()
+            etag = f'"{profile_etag(client_id, version)}"'
+            if version is not None and etag_matches(if_none_match, etag):
+                return await self.respond(send, 304, b'', headers=[(b'etag', etag.encode())])
+
+        loop = asyncio.get_running_loop()
+        # The profile cache does blocking file I/O, so keep it off the event
+        # loop and out of the crypto pool
+        profiles = await loop.run_in_executor(None, profile_cache.get_many, [client_id])
+        if client_id not in profiles:
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(profile_query([client_id]))).mappings().all()
+            loaded = collect_profiles({}, rows)
+            if loaded:
+                await loop.run_in_executor(None, profile_cache.set_many, loaded)
+                # As in cache_profiles(): undo the set if a write committed since the load
+                async with self.engine.connect() as conn:
+                    version = (await conn.execute(
+                        select(Client.version).where(Client.id == client_id)
+                    )).scalar()
+                if version != loaded[client_id]['version']:
+                    await loop.run_in_executor(None, profile_cache.invalidate, client_id)
+            profiles.update(loaded)
+        profile = (await loop.run_in_executor(self.crypto, decrypt_profiles, [client_id], profiles))[0]
+        if profile is None:
+            return await self.respond_json(send, 404, {'error': 'Client not found'})
+        headers = []
+        if profile.get('version'):
+            headers.append((b'etag', f'"{profile_etag(client_id, profile["version"])}"'.encode()))
+        await self.respond_json(send, 200, profile, headers)
+
+app = AsyncApp(create_app())
@@ -0,0 +1,129 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from models import db
+
+class WriteBatcher:
+    """
+    Group commit for small writes. When enabled, request threads hand their
+    inserts to a single writer thread, which runs every job that arrives
+    within a short window in one transaction and pays for one commit. Each
+    request blocks on a future that resolves to its job's return value once
+    that commit has succeeded.
+
+    Disabled by default, in which case run() executes the job and commits
+    in the calling request's own session.
+
+    Jobs name the one shard they write. The writer commits each shard's
+    jobs in a transaction of their own, so a batch never holds one shard's
+    lock while waiting for another's. Jobs that may write several shards
+    pass shard=None and run unbatched.
+    """
+
+    def __init__(self, max_batch=0, window_ms=2):
+        self.max_batch = max_batch
+        self.window_ms = window_ms
+        self.app = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.max_batch = app.config.get('WRITE_BATCH_SIZE', self.max_batch)
+        self.window_ms = app.config.get('WRITE_BATCH_WINDOW_MS', self.window_ms)
+        # A writer already running serves an earlier app; stop it so the
+        # next job starts one for this app
+        with self._lock:
+            self._queue.put(None)
+            self._queue = queue.Queue()
+            self._pid = None
+
+    @property
+    def enabled(self):
+        return self.max_batch > 1
+
+    def run(self, fn, *args, shard=0):
+        """Run fn(*args) and commit it, batched with concurrent writes to shard if enabled."""
+        if not self.enabled or shard is None:
+            result = fn(*args)
+            db.session.commit()
+            return result
+        # End the request's read transaction so reads after the batch
+        # commit see its rows
+        db.session.commit()
+        return self.submit(fn, *args, shard=shard).result()
+
+    def submit(self, fn, *args, shard=0):
+        future = Future()
+        self._ensure_writer()
+        self._queue.put((shard, (fn, args, future)))
+        return future
+
+    def _ensure_writer(self):
+        # Threads do not survive fork, so each worker starts its own writer
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._writer, args=(self._queue,), name='his-write-batcher', daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _writer(self, jobs_queue):
+        with self.app.app_context():
+            while True:
+                job = jobs_queue.get()
+                if job is None:
+                    return
+                jobs = [job]
+                deadline = time.monotonic() + self.window_ms / 1000
+                while len(jobs) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        job = jobs_queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        jobs_queue.put(None)
+                        break
+                    jobs.append(job)
+                by_shard = {}
+                for shard, job in jobs:
+                    by_shard.setdefault(shard, []).append(job)
+                for shard in sorted(by_shard):
+                    self._commit(by_shard[shard])
+
+    def _commit(self, jobs):
+        try:
+            results = [fn(*args) for fn, args, _ in jobs]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # One bad job must not fail the others: retry each on its own
+            for job in jobs:
+                self._commit_one(*job)
+            return
+        for (_, _, future), result in zip(jobs, results):
+            future.set_result(result)
+
+    def _commit_one(self, fn, args, future):
+        try:
+            result = fn(*args)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+write_batcher = WriteBatcher()
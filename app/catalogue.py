@@ -0,0 +1,90 @@
+import re
+from sqlalchemy import func, inspect, select, text
+from models import db, ChangeLog, Program
+from pagination import keyset
+from serialization import row_serializer
+
+# program_id is stored in the FTS table rather than using external content
+# keyed by rowid, because VACUUM may renumber rowids of a table whose
+# primary key is not an INTEGER.
+FTS_DDL = (
+    "CREATE VIRTUAL TABLE program_fts USING fts5("
+    "program_id UNINDEXED, name, description, tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS program_fts_insert AFTER INSERT ON program BEGIN "
+    "INSERT INTO program_fts (program_id, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS program_fts_delete AFTER DELETE ON program BEGIN "
+    "DELETE FROM program_fts WHERE program_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS program_fts_update AFTER UPDATE OF id, name, description ON program BEGIN "
+    "DELETE FROM program_fts WHERE program_id = old.id; "
+    "INSERT INTO program_fts (program_id, name, description) VALUES (new.id, new.name, new.description); END"
+)
+
+# bm25 column weights: program_id (unindexed), name, description
+SEARCH_SQL = (
+    "SELECT program.id, program.name, program.description, program.created_at "
+    "FROM program_fts JOIN program ON program.id = program_fts.program_id "
+    "WHERE program_fts MATCH :query "
+    "ORDER BY bm25(program_fts, 0.0, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+)
+
+def has_fts():
+    return db.engine.dialect.name == 'sqlite'
+
+def ensure_program_search():
+    """Create the program FTS5 index and its sync triggers, filling it on first creation."""
+    if not has_fts():
+        return
+    with db.engine.begin() as conn:
+        if not inspect(conn).has_table('program_fts'):
+            conn.execute(text(FTS_DDL[0]))
+            conn.execute(text(
+                'INSERT INTO program_fts (program_id, name, description) '
+                'SELECT id, name, description FROM program'
+            ))
+        for ddl in FTS_DDL[1:]:
+            conn.execute(text(ddl))
+
+def match_expression(query):
+    """FTS5 query requiring every word of query as a prefix; None if it has no words."""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+def search_programs(query, limit, offset=0):
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    if has_fts():
+        table = Program.__table__.c
+        rows = db.session.execute(
+            text(SEARCH_SQL).columns(table.id, table.name, table.description, table.created_at),
+            {'query': expression, 'limit': limit, 'offset': offset}
+        ).all()
+    else:
+        pattern = f'%{query}%'
+        rows = db.session.execute(
+            select(Program.id, Program.name, Program.description, Program.created_at)
+            .where(Program.name.ilike(pattern) | Program.description.ilike(pattern))
+            .order_by(Program.name).limit(limit).offset(offset)
+        ).all()
+    return [serialize_program(row) for row in rows]
+
+def catalogue_generation():
+    """
+    Id of the newest program change on the primary database. Change log ids
+    never repeat, so this moves with every program write in any worker,
+    even a delete followed by an insert, and can key cached search results
+    without a shared counter. One lookup in ix_change_log_entity_id.
+    """
+    return db.session.execute(
+        select(func.max(ChangeLog.id)).where(ChangeLog.entity == 'program')
+    ).scalar() or 0
+
+def program_listing(cursor=None):
+    return keyset(
+        select(Program.id, Program.name, Program.description, Program.created_at),
+        Program.created_at, Program.id, cursor
+    )
+
+serialize_program = row_serializer('id', 'name', 'description', 'created_at')
@@ -0,0 +1,106 @@
+import heapq
+import time
+from datetime import datetime
+from itertools import islice
+from operator import attrgetter
+from sqlalchemy import select
+from models import db, ChangeLog
+from pagination import page_limit
+from serialization import row_serializer
+from sharding import shards
+
+# How often a long poll re-checks the log
+POLL_INTERVAL = 0.25
+# Longest a /changes long poll may wait, in seconds
+MAX_WAIT = 30
+ARGS_ERROR = 'since must be a cursor from next; limit and wait must be integers'
+
+serialize_change = row_serializer('id', 'entity', 'entity_id', 'op', 'created_at')
+
+def record_changes(entity, op, entity_ids):
+    """Append one change per id in the caller's transaction, so it commits with the write."""
+    if not entity_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(ChangeLog.__table__.insert(), [
+        {'entity': entity, 'entity_id': entity_id, 'op': op, 'created_at': now}
+        for entity_id in entity_ids
+    ])
+
+def enrollment_id(client_id, program_id):
+    return f'{client_id}:{program_id}'
+
+def parse_cursor(value):
+    """
+    Change log positions, one per shard, from a /changes cursor. Unsharded
+    cursors are a change id; sharded ones join one id per shard with '.'.
+    A single id resumes shard 0 and reads the others from the start.
+
+    Raises:
+        ValueError: If value is not a cursor for this shard count
+    """
+    positions = [int(part) for part in str(value or 0).split('.')]
+    if len(positions) == 1:
+        positions += [0] * (shards.count - 1)
+    if len(positions) != shards.count or min(positions) < 0:
+        raise ValueError(f'Invalid cursor: {value}')
+    return positions
+
+def parse_changes_args(args):
+    """
+    Positions, page size and long-poll wait from /changes query args.
+
+    Raises:
+        ValueError: If since is not a cursor or limit or wait is not an integer
+    """
+    positions = parse_cursor(args.get('since', 0))
+    wait = min(max(int(args.get('wait', 0)), 0), MAX_WAIT)
+    return positions, page_limit(args), wait
+
+def format_cursor(positions):
+    return positions[0] if not shards.enabled else '.'.join(map(str, positions))
+
+def changes_since(positions, limit):
+    """
+    Up to limit changes after positions, and the positions to resume from.
+    Each shard's log is read in id order; with sharding the logs are merged
+    by time and each change carries its shard.
+    """
+    logs = []
+    for shard in range(shards.count):
+        with shards.on_shard(shard):
+            logs.append([(shard, row) for row in db.session.execute(change_query(positions[shard], limit))])
+    return merge_changes(logs, positions, limit)
+
+def change_query(position, limit):
+    """Up to limit changes after position on one shard's log, in id order."""
+    return (
+        select(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op, ChangeLog.created_at)
+        .where(ChangeLog.id > position)
+        .order_by(ChangeLog.id)
+        .limit(limit)
+    )
+
+def merge_changes(logs, positions, limit):
+    """Serialize up to limit changes from per-shard (shard, row) logs and advance positions."""
+    positions = list(positions)
+    changes = []
+    # merge() consumes each log in order, so every shard's position only moves forward
+    for shard, row in islice(heapq.merge(*logs, key=lambda item: item[1].created_at), limit):
+        positions[shard] = row.id
+        change = serialize_change(row)
+        if shards.enabled:
+            change['shard'] = shard
+        changes.append(change)
+    return changes, positions
+
+def wait_for_changes(positions, limit, timeout):
+    """changes_since(), polling for up to timeout seconds while there are none."""
+    deadline = time.monotonic() + timeout
+    while True:
+        changes, next_positions = changes_since(positions, limit)
+        if changes or time.monotonic() >= deadline:
+            return changes, next_positions
+        # End the read transaction so the next poll sees new commits
+        db.session.rollback()
+        time.sleep(POLL_INTERVAL)
@@ -0,0 +1,118 @@
+import os
+import click
+from cryptography.fernet import Fernet
+from flask import current_app
+from flask.cli import with_appcontext
+from models import migrate_ids
+from profile_cache import profile_cache
+from sharding import shards
+from tokens import api_tokens
+from rotation import rotate_client_keys
+from stats import rebuild_stats
+from transfer import export_data, import_data
+
+@click.group('his', help='Health Information System maintenance commands.')
+def his():
+    pass
+
+@his.command('new-key')
+def new_key():
+    """Print a fresh Fernet key to prepend to HIS_FERNET_KEYS or the keyfile."""
+    click.echo(Fernet.generate_key().decode())
+
+@his.command('rotate-keys')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per read, re-encrypt and commit.')
+@click.option('--workers', type=int, default=None, help='Encryption processes (default: CPU count).')
+@click.option('--max-rate', type=int, default=0, show_default=True, help='Rows per second limit, 0 for none.')
+@click.option('--checkpoint', 'checkpoint_path', default=None,
+              help='Progress file (default: instance/rotate_keys.json).')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the first client.')
+@with_appcontext
+def rotate_keys(chunk_size, workers, max_rate, checkpoint_path, restart):
+    """
+    Re-encrypt client fields under the newest key. Prepend the new key,
+    restart the app, run this, then drop the old key once it finishes.
+    """
+    checkpoint_path = checkpoint_path or os.path.join(current_app.instance_path, 'rotate_keys.json')
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    rotated = rotate_client_keys(chunk_size, workers, max_rate, checkpoint_path, report=click.echo)
+    # Cached profiles hold the old ciphertext, which stops decrypting once the old key is dropped
+    profile_cache.clear()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    click.echo(f'Done: {rotated} rows re-encrypted.')
+
+@his.command('export')
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+@click.option('--encrypted', is_flag=True,
+              help='Keep name and date_of_birth encrypted; the importing site needs the same keys.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows fetched per round trip.')
+@with_appcontext
+def export_command(directory, fmt, encrypted, batch_size):
+    """Export programs, clients and enrollments to DIRECTORY."""
+    counts = export_data(directory, fmt, encrypted, batch_size)
+    click.echo(', '.join(f'{count} {entity}' for entity, count in counts.items()) + ' exported.')
+
+@his.command('import')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--batch-size', default=10000, show_default=True, help='Rows inserted per transaction.')
+@with_appcontext
+def import_command(directory, batch_size):
+    """Import a directory written by 'flask his export'."""
+    try:
+        counts = import_data(directory, batch_size, report=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(', '.join(f'{count} {entity}' for entity, count in counts.items()) + ' imported.')
+
+@his.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Recompute program enrollment statistics from scratch."""
+    rebuild_stats(report=click.echo)
+    click.echo('Program statistics rebuilt.')
+
+@his.command('migrate-ids')
+@click.option('--to', 'target', type=click.Choice(['binary', 'text']), default='binary', show_default=True,
+              help='binary for HIS_ID_SCHEME=uuid7, text for uuid4.')
+@click.option('--vacuum', is_flag=True, help='Rebuild the database file afterwards to reclaim the space saved.')
+@with_appcontext
+def migrate_ids_command(target, vacuum):
+    """
+    Convert stored client and program ids, and every reference to them,
+    between text and 16-byte binary. Stop the app first and restart it with
+    the matching HIS_ID_SCHEME. Existing ids keep their values.
+    """
+    for shard in range(shards.count):
+        engine = shards.engine(shard)
+        try:
+            counts = migrate_ids(target == 'binary', engine, shards.local_tables() if shard else None)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        for column, count in counts.items():
+            click.echo(f'{engine.url.database}: {column}: {count} rows converted')
+        if vacuum:
+            with engine.connect() as conn:
+                conn.exec_driver_sql('VACUUM')
+    click.echo(f'Ids are now stored as {target}.')
+
+@his.command('issue-token')
+@click.argument('principal')
+@with_appcontext
+def issue_token(principal):
+    """Create an API token for PRINCIPAL and print it. Only its hash is stored."""
+    token_id, token = api_tokens.issue(principal)
+    click.echo(f'Token {token_id} for {principal}: {token}')
+    click.echo('Store it now; it cannot be shown again.')
+
+@his.command('revoke-token')
+@click.argument('token_id', type=int)
+@with_appcontext
+def revoke_token(token_id):
+    """Revoke the API token with id TOKEN_ID."""
+    if not api_tokens.revoke(token_id):
+        raise click.ClickException(f'No active token with id {token_id}.')
+    click.echo(f'Token {token_id} revoked; other workers stop accepting it within AUTH_CACHE_TTL seconds.')
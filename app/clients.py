@@ -0,0 +1,104 @@
+from datetime import datetime
+from operator import attrgetter, itemgetter
+from sqlalchemy import select
+from models import db, Client, ClientSearchToken
+from ids import new_id
+from changes import record_changes
+from decryption import decryptor
+from stats import birth_bucket
+from pagination import encode_cursor, keyset
+from search_index import matching_client_ids, token_rows
+from sharding import shards
+from utils import encrypt_many
+
+# Rows fetched and decrypted per round trip when streaming NDJSON
+STREAM_BATCH_SIZE = 500
+
+def create_clients(records, encrypted=False, ids=None, imported=False):
+    """
+    Insert validated client records and their search tokens with
+    executemany-style inserts. The caller owns the transaction.
+
+    Args:
+        records (list): Dicts matching CLIENT_SCHEMA
+        encrypted (bool): name and date_of_birth are already ciphertext
+        ids (list): Ids for the new clients, e.g. chosen in advance to pick
+            their shard; generated when not given
+        imported (bool): Records come from an export, so their id and
+            created_at (a datetime) are kept. Anything else ignores them.
+
+    Returns:
+        list: The inserted client rows, with name and date_of_birth encrypted
+    """
+    if not records:
+        return []
+    values = [value for record in records for value in (record['name'], record['date_of_birth'])]
+    if encrypted:
+        ciphertexts = iter(values)
+        plaintexts = iter(decryptor.decrypt_many(values))
+    else:
+        ciphertexts = iter(encrypt_many(values))
+        plaintexts = iter(values)
+    now = datetime.utcnow()
+    ids = iter(ids or ())
+    rows = []
+    tokens = {}
+    for record in records:
+        name, date_of_birth = next(plaintexts), next(plaintexts)
+        kept = record if imported else {}
+        client_id = next(ids, None) or kept.get('id') or new_id()
+        rows.append({
+            'id': client_id,
+            'name': next(ciphertexts),
+            'date_of_birth': next(ciphertexts),
+            'gender': record['gender'],
+            'created_at': kept.get('created_at') or now,
+            'version': 1,
+            'birth_bucket': birth_bucket(date_of_birth)
+        })
+        tokens[client_id] = token_rows(client_id, name)
+    for shard, shard_rows in shards.group(rows, itemgetter('id')).items():
+        with shards.on_shard(shard):
+            db.session.execute(Client.__table__.insert(), shard_rows)
+            shard_tokens = [token for row in shard_rows for token in tokens[row['id']]]
+            # Inserting in key order touches each index page once instead of at random
+            shard_tokens.sort(key=itemgetter('token'))
+            if shard_tokens:
+                db.session.execute(ClientSearchToken.__table__.insert(), shard_tokens)
+            record_changes('client', 'create', [row['id'] for row in shard_rows])
+    return rows
+
+def client_listing(name='', cursor=None):
+    """Select of clients whose name matches name, in keyset order after cursor."""
+    query = select(Client.id, Client.name, Client.date_of_birth, Client.gender, Client.created_at)
+    # Names are encrypted, so match through the blind index and
+    # only decrypt the rows it returns
+    matches = matching_client_ids(name)
+    if matches is not None:
+        query = query.where(Client.id.in_(matches))
+    return keyset(query, Client.created_at, Client.id, cursor)
+
+# Sort key of client_listing() rows, for merging pages from several shards
+listing_key = attrgetter('created_at', 'id')
+
+def split_page(rows, limit):
+    """Trim rows fetched with limit + 1 to a page and its next cursor."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, None
+
+def serialize_clients(rows):
+    plaintexts = iter(decryptor.decrypt_many(
+        [value for row in rows for value in (row.name, row.date_of_birth)]
+    ))
+    return [
+        {
+            'id': row.id,
+            'name': next(plaintexts),
+            'date_of_birth': next(plaintexts),
+            'gender': row.gender,
+            'created_at': row.created_at
+        }
+        for row in rows
+    ]
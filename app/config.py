@@ -1,5 +1,89 @@
+import os
+
 class Config:
+    # Where clients, programs and enrollments live: 'sql' (the database
+    # below) or 'memory' (memory_store.py; API tokens stay in the database)
+    STORAGE_BACKEND = 'sql'
+    # memory: load the store from this file at startup and save it there
+    # every interval seconds (0 disables) while it changes, and on exit
+    MEMORY_SNAPSHOT_PATH = None
+    MEMORY_SNAPSHOT_INTERVAL = 60
     SQLALCHEMY_DATABASE_URI = 'sqlite:///../health_system.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     CACHE_TYPE = 'SimpleCache'
-    SECRET_KEY = 'mysecretkey'
\ No newline at end of file
+    SECRET_KEY = 'mysecretkey'
+    # Plaintext LRU for decrypted client fields
+    DECRYPT_CACHE_SIZE = 10000
+    DECRYPT_CACHE_TTL = 300
+    DECRYPT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+    # Threads used to decrypt large result sets; 0 decrypts inline
+    DECRYPT_WORKERS = 0
+    # Client profile cache; 'sqlite' is shared by all workers on a host,
+    # 'cache' uses the Flask-Caching backend configured above
+    PROFILE_CACHE_BACKEND = 'sqlite'
+    PROFILE_CACHE_PATH = None
+    PROFILE_CACHE_TTL = 6 * 3600
+    # Records inserted and committed per transaction by bulk endpoints
+    BULK_CHUNK_SIZE = 5000
+    # Group commit for single registrations and enrollments: up to this many
+    # requests share one transaction, waiting at most the window for company.
+    # 0 commits every request on its own
+    WRITE_BATCH_SIZE = 0
+    WRITE_BATCH_WINDOW_MS = 2
+    # Compress JSON, NDJSON and CSV responses at least this large with br or
+    # gzip when the client accepts it; None disables
+    COMPRESS_MIN_BYTES = 1024
+    COMPRESS_LEVEL = 6
+    # Client, search token and enrollment rows split across this many SQLite
+    # files by a hash of the client id; shard 0 is SQLALCHEMY_DATABASE_URI
+    SHARD_COUNT = 1
+    SHARD_DATABASE_URI = 'sqlite:///../health_system.shard{shard}.db'
+    # Verified API token principals cached per process; revocations reach
+    # other processes within the TTL
+    AUTH_CACHE_SIZE = 10000
+    AUTH_CACHE_TTL = 60
+    # Cached program search results; a new program invalidates them in every worker
+    PROGRAM_SEARCH_CACHE_TTL = 300
+    # Log requests slower than this, with their SQL statements; None disables
+    SLOW_REQUEST_MS = None
+    # ASGI serving (asgi.py): requests handled at once, threads for Fernet work,
+    # and threads running the routes handed to the Flask app
+    ASYNC_MAX_CONCURRENCY = 1000
+    CRYPTO_WORKERS = os.cpu_count() or 4
+    WSGI_WORKERS = 32
+    ASYNC_ENGINE_OPTIONS = {}
+
+class SQLiteProductionConfig(Config):
+    """
+    SQLite tuned for concurrent workers: WAL lets readers run alongside the
+    single writer, and the busy timeout makes writers wait for the lock
+    instead of failing with "database is locked".
+    """
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 10,
+        'pool_timeout': 30,
+        'pool_recycle': 3600,
+        'connect_args': {'timeout': 30, 'check_same_thread': False}
+    }
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 30000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative values are KiB
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON'
+    }
+
+class MemoryConfig(Config):
+    """In-memory store for edge boxes, snapshotted to HIS_MEMORY_SNAPSHOT if set."""
+    STORAGE_BACKEND = 'memory'
+    MEMORY_SNAPSHOT_PATH = os.environ.get('HIS_MEMORY_SNAPSHOT')
+    MEMORY_SNAPSHOT_INTERVAL = float(os.environ.get('HIS_MEMORY_SNAPSHOT_INTERVAL', 60))
+
+CONFIGS = {
+    'default': Config,
+    'sqlite-production': SQLiteProductionConfig,
+    'memory': MemoryConfig
+}
@@ -0,0 +1,103 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+from utils import decrypt_data
+
+class DecryptionService:
+    """
+    Decrypts whole result sets in one call and keeps a bounded LRU of
+    plaintext keyed by ciphertext. Entries expire after ttl seconds and the
+    cache is capped by entry count and by approximate memory use.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300, max_bytes=16 * 1024 * 1024,
+                 workers=0, parallel_threshold=64):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('DECRYPT_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('DECRYPT_CACHE_TTL', self.ttl)
+        self.max_bytes = app.config.get('DECRYPT_CACHE_MAX_BYTES', self.max_bytes)
+        self.workers = app.config.get('DECRYPT_WORKERS', self.workers)
+        self.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def decrypt(self, value):
+        return self.decrypt_many([value])[0]
+
+    def decrypt_many(self, values):
+        """Decrypt values in order, decrypting each distinct ciphertext at most once."""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for value in values:
+                if value in found:
+                    continue
+                entry = self._entries.get(value)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(value)
+                    found[value] = entry[0]
+                else:
+                    found[value] = None
+                    missing.append(value)
+            self.misses += len(missing)
+            self.hits += len(found) - len(missing)
+
+        if missing:
+            plaintexts = self._decrypt_uncached(missing)
+            found.update(zip(missing, plaintexts))
+            self._store(zip(missing, plaintexts), now + self.ttl)
+
+        return [found[value] for value in values]
+
+    def _decrypt_uncached(self, values):
+        if self.workers and len(values) >= self.parallel_threshold:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            chunk = -(-len(values) // self.workers)
+            chunks = [values[i:i + chunk] for i in range(0, len(values), chunk)]
+            # Pool threads have no request context, so time the whole batch here
+            with metrics.crypto_timer():
+                results = self._pool.map(lambda part: [decrypt_data(v) for v in part], chunks)
+                return [plaintext for part in results for plaintext in part]
+        return [decrypt_data(value) for value in values]
+
+    def _store(self, items, expires):
+        if not self.max_entries:
+            return
+        with self._lock:
+            for ciphertext, plaintext in items:
+                old = self._entries.pop(ciphertext, None)
+                if old is not None:
+                    self._bytes -= old[2]
+                size = sys.getsizeof(ciphertext) + sys.getsizeof(plaintext)
+                self._entries[ciphertext] = (plaintext, expires, size)
+                self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+
+decryptor = DecryptionService()
@@ -0,0 +1,128 @@
+import sqlite3
+from datetime import datetime
+from sqlalchemy import and_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Client, Program, enrollment
+from changes import enrollment_id, record_changes
+from sharding import shards
+from stats import count_enrollments
+
+# Ids per IN (...) list. SQLite allows 32766 bound parameters per
+# statement since 3.32 and 999 before.
+CHUNK_SIZE = 10000 if sqlite3.sqlite_version_info >= (3, 32) else 500
+
+def insert_ignore():
+    """
+    INSERT into enrollment that skips pairs already present, returning the
+    (client_id, program_id) pairs it actually inserted.
+    """
+    dialect = sqlite if db.session.get_bind().dialect.name == 'sqlite' else postgresql
+    return dialect.insert(enrollment).on_conflict_do_nothing(
+        index_elements=['client_id', 'program_id']
+    ).returning(enrollment.c.client_id, enrollment.c.program_id)
+
+def _enroll(fixed_column, fixed_id, other_column, other_model, ids, attributes=()):
+    """
+    Insert the missing pairs of fixed_id with each of ids and log them as
+    changes. attributes are other_model columns read in the same SELECT
+    that checks which ids exist and are already enrolled.
+
+    Returns:
+        tuple: The result lists, the inserted (client_id, program_id) pairs
+            and the attributes of each id found
+    """
+    ids = list(dict.fromkeys(ids))
+    enrolled, already_enrolled, not_found = [], [], []
+    inserted, found_attributes = [], {}
+    statement = insert_ignore()
+    now = datetime.utcnow()
+    for i in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[i:i + CHUNK_SIZE]
+        # One SELECT finds the ids, their attributes and any existing pair
+        rows = db.session.execute(
+            select(other_model.id, fixed_column, *attributes)
+            .select_from(other_model.__table__.outerjoin(
+                enrollment, and_(other_column == other_model.id, fixed_column == fixed_id)
+            ))
+            .where(other_model.id.in_(chunk))
+        ).all()
+        found = {row[0]: tuple(row[2:]) for row in rows}
+        found_attributes.update(found)
+        existing = {row[0] for row in rows if row[1] is not None}
+        new = []
+        for other_id in chunk:
+            if other_id not in found:
+                not_found.append(other_id)
+            elif other_id in existing:
+                already_enrolled.append(other_id)
+            else:
+                new.append(other_id)
+        if new:
+            # A concurrent request may insert some of these pairs after the
+            # check above, so only the pairs RETURNING reports are counted
+            # In key order, each index page is touched once instead of at random
+            rows = db.session.execute(statement, [
+                {fixed_column.key: fixed_id, other_column.key: other_id, 'created_at': now}
+                for other_id in sorted(new)
+            ]).all()
+            inserted.extend(rows)
+            inserted_ids = {row._mapping[other_column] for row in rows}
+            for other_id in new:
+                (enrolled if other_id in inserted_ids else already_enrolled).append(other_id)
+    record_changes('enrollment', 'create', [
+        enrollment_id(client_id, program_id) for client_id, program_id in inserted
+    ])
+    result = {'enrolled': enrolled, 'already_enrolled': already_enrolled, 'not_found': not_found}
+    return result, inserted, found_attributes
+
+def touch_clients(client_ids):
+    """Bump version and updated_at of clients whose profile changed."""
+    now = datetime.utcnow()
+    for i in range(0, len(client_ids), CHUNK_SIZE):
+        db.session.execute(
+            update(Client.__table__)
+            .where(Client.id.in_(client_ids[i:i + CHUNK_SIZE]))
+            .values(version=Client.version + 1, updated_at=now)
+        )
+
+def enroll_clients(program_id, client_ids):
+    """Enroll many clients in one program. The caller owns the transaction."""
+    result = {'enrolled': [], 'already_enrolled': [], 'not_found': []}
+    for shard, ids in shards.group(dict.fromkeys(client_ids)).items():
+        with shards.on_shard(shard):
+            shard_result, inserted, attributes = _enroll(
+                enrollment.c.program_id, program_id, enrollment.c.client_id, Client, ids,
+                (Client.gender, Client.birth_bucket)
+            )
+            count_enrollments(inserted, attributes)
+            touch_clients(shard_result['enrolled'])
+        for key, ids in shard_result.items():
+            result[key].extend(ids)
+    return result
+
+def enroll_programs(client_id, program_ids):
+    """Enroll one client in many programs. The caller owns the transaction."""
+    with shards.for_client(client_id):
+        result, inserted, _ = _enroll(
+            enrollment.c.client_id, client_id, enrollment.c.program_id, Program, program_ids
+        )
+        if inserted:
+            attributes = db.session.execute(
+                select(Client.gender, Client.birth_bucket).where(Client.id == client_id)
+            ).one()
+            count_enrollments(inserted, {client_id: tuple(attributes)})
+            touch_clients([client_id])
+    return result
+
+def enrolled_program_names(client_id):
+    with shards.for_client(client_id):
+        return list(db.session.execute(
+            select(Program.name)
+            .join(enrollment, enrollment.c.program_id == Program.id)
+            .where(enrollment.c.client_id == client_id)
+        ).scalars())
+
+def exists(model, id):
+    # Programs are on every shard, so only clients need routing
+    with shards.for_client(id) if model is Client else shards.on_shard(0):
+        return db.session.execute(select(model.id).where(model.id == id)).first() is not None
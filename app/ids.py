@@ -0,0 +1,59 @@
+import os
+import time
+import uuid
+from sqlalchemy import LargeBinary, String
+from sqlalchemy.types import TypeDecorator
+
+# 'uuid4' stores random ids as 36-character text. 'uuid7' stores
+# time-ordered ids as 16-byte blobs, so new rows append to the end of each
+# index. Run 'flask his migrate-ids' before switching an existing database.
+ID_SCHEME = os.environ.get('HIS_ID_SCHEME', 'uuid4')
+if ID_SCHEME not in ('uuid4', 'uuid7'):
+    raise ValueError(f"HIS_ID_SCHEME must be 'uuid4' or 'uuid7', not {ID_SCHEME!r}")
+BINARY_IDS = ID_SCHEME == 'uuid7'
+
+def uuid7():
+    """UUID whose first 48 bits are the Unix time in milliseconds (RFC 9562)."""
+    millis = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), 'big')
+    return uuid.UUID(int=(
+        (millis & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | (rand >> 68) << 64
+        | 0b10 << 62
+        | rand & 0x3FFF_FFFF_FFFF_FFFF
+    ))
+
+def new_id():
+    return str(uuid7() if BINARY_IDS else uuid.uuid4())
+
+def id_bytes(value):
+    """16-byte form of an id string. Strings that are not UUIDs match no stored id."""
+    try:
+        return uuid.UUID(value).bytes
+    except ValueError:
+        return value.encode()
+
+def id_text(value):
+    return str(uuid.UUID(bytes=value)) if len(value) == 16 else value.decode()
+
+class Identifier(TypeDecorator):
+    """
+    Primary and foreign keys of clients and programs. Always canonical
+    strings in Python; stored as text or as 16-byte blobs per HIS_ID_SCHEME.
+    """
+    impl = String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(LargeBinary(16) if BINARY_IDS else String(36))
+
+    def process_bind_param(self, value, dialect):
+        if BINARY_IDS and isinstance(value, str):
+            return id_bytes(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        # Blobs are read back as strings under either scheme, so a
+        # database part way through migrate-ids still reads correctly
+        return id_text(value) if isinstance(value, bytes) else value
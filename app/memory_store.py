@@ -0,0 +1,712 @@
+"""
+In-memory storage behind the routes, for edge boxes and tests
+(STORAGE_BACKEND = 'memory'). The store lives in one process, so serve it
+with a single worker; threads are fine.
+"""
+import atexit
+import bisect
+import heapq
+import json
+import logging
+import os
+import signal
+import struct
+import sys
+import threading
+from array import array
+from collections import Counter
+from datetime import date, datetime, timedelta
+from changes import enrollment_id
+from ids import id_bytes, id_text, new_id
+from pagination import decode_cursor, encode_cursor
+from search_index import name_terms, normalize_name, query_terms
+from stats import birth_bucket, summarize
+from utils import blind_index, cipher
+
+logger = logging.getLogger(__name__)
+
+GENDERS = ('Male', 'Female', 'Other')
+GENDER_CODES = {gender: code for code, gender in enumerate(GENDERS)}
+# Change log entity codes
+CLIENT, PROGRAM, ENROLLMENT = range(3)
+ENTITIES = ('client', 'program', 'enrollment')
+EPOCH = datetime(1970, 1, 1)
+EMPTY = array('I')
+# End of a client's enrollment list
+NO_EDGE = -1
+# Empty IdIndex slot
+NO_POSITION = -1
+# Clients per batch when streaming NDJSON
+STREAM_BATCH_SIZE = 500
+
+SNAPSHOT_MAGIC = b'HISMEM2\0'
+# Sections holding names and dates of birth, written as Fernet tokens
+ENCRYPTED_SECTIONS = ('names', 'birth_dates')
+
+def to_micros(moment):
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class Program:
+    """
+    A health program.
+
+    Args:
+        id (string): Program id
+        name (string): Holds the name of the program
+        description (string): Describes the program
+        created_us (int): Creation time in microseconds since the epoch
+    """
+    __slots__ = ('id', 'name', 'description', 'created_us')
+
+    def __init__(self, id, name, description, created_us):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.created_us = created_us
+
+
+class IdIndex:
+    """
+    Positions of the 16-byte ids stored back to back in ids, in an
+    open-addressing hash table of 32-bit slots. That is about 6 bytes per
+    id, where a dict of bytes keys to ints costs over 100.
+    """
+
+    def __init__(self, ids, slots=None):
+        self.ids = ids
+        self.slots = array('i', [NO_POSITION]) * 1024 if slots is None else slots
+
+    def id(self, position):
+        return bytes(self.ids[position * 16:position * 16 + 16])
+
+    def _probe(self, id):
+        """The slot holding id, or the empty slot where it belongs."""
+        mask = len(self.slots) - 1
+        # The last 8 bytes of uuid4 and uuid7 ids are random
+        slot = int.from_bytes(id[8:], 'big') & mask
+        while True:
+            position = self.slots[slot]
+            if position == NO_POSITION or self.ids[position * 16:position * 16 + 16] == id:
+                return slot
+            slot = (slot + 1) & mask
+
+    def get(self, id):
+        if len(id) != 16:
+            return None
+        position = self.slots[self._probe(id)]
+        return None if position == NO_POSITION else position
+
+    def add(self, position):
+        """Index the id stored at position, keeping the table at most half full."""
+        if (position + 1) * 2 > len(self.slots):
+            self.slots = array('i', [NO_POSITION]) * (len(self.slots) * 2)
+            for earlier in range(position):
+                self.slots[self._probe(self.id(earlier))] = earlier
+        self.slots[self._probe(self.id(position))] = position
+
+
+class MemoryStore:
+    """
+    Clients, programs and enrollments held in memory, sized for edge boxes:
+    a million clients with two enrollments each take about 600 MB (see
+    benchmarks/edge.py).
+
+    Clients are columns indexed by position: 16-byte ids and UTF-8 names
+    back to back in buffers, and arrays of dates of birth, genders,
+    creation times and versions. Ids are found through an IdIndex.
+    Enrollments are edges in parallel arrays, linked per client, so each
+    costs 12 bytes instead of an object. Names are indexed by the blind
+    index of each word and prefix, as in the SQL backend, and a
+    (created_at, id) order index gives GET /clients the same keyset pages.
+    The change log is kept as arrays too, and its length counts writes, so
+    callers can tell whether a new snapshot is needed.
+
+    Every column only grows except first_enrollment, versions, the id index
+    and the order index, which is what lets snapshot() copy those few under
+    the lock and read the rest after releasing it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self.client_ids = bytearray()
+        self.client_positions = IdIndex(self.client_ids)
+        self.names = bytearray()
+        self.name_ends = array('Q')
+        self.birth_dates = array('i')  # date ordinals
+        self.genders = array('B')
+        self.created = array('q')  # microseconds since the epoch
+        self.versions = array('I')
+        self.first_enrollment = array('i')
+        self.edge_client = array('I')
+        self.edge_program = array('I')
+        self.next_enrollment = array('i')
+        self.programs = []
+        self.program_positions = {}
+        # (gender, birth_bucket) counters per program position
+        self.program_counts = []
+        # Blind index of each name term -> client positions, ascending
+        self.tokens = {}
+        # Client positions sorted by (created_us, id), with their created_us
+        self._order = array('I')
+        self._order_keys = array('q')
+        self.change_entities = array('B')
+        self.change_positions = array('I')
+        self.change_created = array('q')
+
+    @property
+    def writes(self):
+        return len(self.change_entities)
+
+    @property
+    def client_count(self):
+        return len(self.client_ids) // 16
+
+    def _record(self, entity, position, now):
+        self.change_entities.append(entity)
+        self.change_positions.append(position)
+        self.change_created.append(now)
+
+    # Programs
+
+    def create_program(self, name, description):
+        now = to_micros(datetime.utcnow())
+        with self._lock:
+            program = Program(new_id(), name, description, now)
+            position = len(self.programs)
+            self.program_positions[program.id] = position
+            self.programs.append(program)
+            self.program_counts.append(Counter())
+            self._record(PROGRAM, position, now)
+            self._changed.notify_all()
+        return self._program_json(program)
+
+    @staticmethod
+    def _program_json(program):
+        return {
+            'id': program.id,
+            'name': program.name,
+            'description': program.description,
+            'created_at': from_micros(program.created_us)
+        }
+
+    def get_program(self, program_id):
+        position = self.program_positions.get(program_id)
+        if position is None:
+            return None
+        # Programs are never updated
+        return dict(self._program_json(self.programs[position]), version=1)
+
+    def list_programs(self, cursor, limit):
+        after = None
+        if cursor:
+            created_at, id = decode_cursor(cursor)
+            after = (to_micros(created_at), id)
+        with self._lock:
+            programs = sorted(self.programs, key=lambda p: (p.created_us, p.id))
+        if after is not None:
+            programs = [p for p in programs if (p.created_us, p.id) > after]
+        page = [self._program_json(program) for program in programs[:limit]]
+        if len(programs) > limit:
+            return page, encode_cursor(page[-1]['created_at'], page[-1]['id'])
+        return page, None
+
+    def search_programs(self, query, limit, offset=0):
+        """
+        Programs whose name or description has a word starting with each
+        word of query, those matching more words by name first.
+        """
+        words = normalize_name(query)
+        if not words:
+            return []
+        with self._lock:
+            programs = list(self.programs)
+        ranked = []
+        for program in programs:
+            name_words = normalize_name(program.name)
+            all_words = name_words + normalize_name(program.description)
+            if all(any(w.startswith(word) for w in all_words) for word in words):
+                in_name = sum(any(w.startswith(word) for w in name_words) for word in words)
+                ranked.append((-in_name, program.name, program.id, program))
+        ranked.sort(key=lambda item: item[:3])
+        return [self._program_json(program) for *_, program in ranked[offset:offset + limit]]
+
+    def program_stats(self, program_id):
+        with self._lock:
+            position = self.program_positions.get(program_id)
+            if position is None:
+                return None
+            counts = sorted(self.program_counts[position].items())
+        return dict(summarize([(*key, count) for key, count in counts]), program_id=program_id)
+
+    def all_program_stats(self):
+        with self._lock:
+            counts = [(program.id, sorted(counter.items()))
+                      for program, counter in zip(self.programs, self.program_counts) if counter]
+        return [
+            dict(summarize([(*key, count) for key, count in program_counts]), program_id=program_id)
+            for program_id, program_counts in sorted(counts)
+        ]
+
+    # Clients
+
+    def _client_position(self, client_id):
+        return self.client_positions.get(id_bytes(client_id))
+
+    def client_exists(self, client_id):
+        return self._client_position(client_id) is not None
+
+    def client_version(self, client_id):
+        position = self._client_position(client_id)
+        return None if position is None else self.versions[position]
+
+    def register_client(self, data):
+        with self._lock:
+            return self._client_json(self._add_clients([data])[0])
+
+    def register_clients(self, records):
+        """Register validated records; returns their new ids in order."""
+        with self._lock:
+            return [id_text(self.client_positions.id(position)) for position in self._add_clients(records)]
+
+    def _add_clients(self, records):
+        now = to_micros(datetime.utcnow())
+        # Encoding and hashing need no lock; sorting by id makes clients
+        # created in the same microsecond append to the order index
+        prepared = sorted(
+            (
+                id_bytes(new_id()),
+                record['name'].encode(),
+                date.fromisoformat(record['date_of_birth']).toordinal(),
+                GENDER_CODES[record['gender']],
+                [blind_index(term) for term in name_terms(record['name'])]
+            )
+            for record in records
+        )
+        with self._lock:
+            positions = []
+            for client_id, name, birth_date, gender, tokens in prepared:
+                position = self.client_count
+                self.client_ids += client_id
+                self.client_positions.add(position)
+                self.names += name
+                self.name_ends.append(len(self.names))
+                self.birth_dates.append(birth_date)
+                self.genders.append(gender)
+                self.created.append(now)
+                self.versions.append(1)
+                self.first_enrollment.append(NO_EDGE)
+                for token in tokens:
+                    self.tokens.setdefault(token, array('I')).append(position)
+                index = self._order_index((now, client_id))
+                self._order_keys.insert(index, now)
+                self._order.insert(index, position)
+                self._record(CLIENT, position, now)
+                positions.append(position)
+            self._changed.notify_all()
+            return positions
+
+    def _client_json(self, position):
+        start = self.name_ends[position - 1] if position else 0
+        return {
+            'id': id_text(self.client_positions.id(position)),
+            'name': self.names[start:self.name_ends[position]].decode(),
+            'date_of_birth': date.fromordinal(self.birth_dates[position]).isoformat(),
+            'gender': GENDERS[self.genders[position]],
+            'created_at': from_micros(self.created[position])
+        }
+
+    # Listing and search
+
+    def _order_key(self, position):
+        return self.created[position], self.client_positions.id(position)
+
+    def _order_index(self, after):
+        """Index in the order index of the first client after the (created_us, id) key."""
+        created_us, client_id = after
+        low = bisect.bisect_left(self._order_keys, created_us)
+        high = bisect.bisect_right(self._order_keys, created_us, lo=low)
+        return bisect.bisect_right(self._order, client_id, lo=low, hi=high, key=self.client_positions.id)
+
+    def _matching_positions(self, name):
+        """Positions of clients whose name matches every word of name, or None without search words."""
+        terms = query_terms(name)
+        if not terms:
+            return None
+        postings = sorted((self.tokens.get(blind_index(term), EMPTY) for term in terms), key=len)
+        matches = set(postings[0])
+        for posting in postings[1:]:
+            if not matches:
+                break
+            matches.intersection_update(posting)
+        return matches
+
+    def _positions_after(self, name, after, count):
+        matches = self._matching_positions(name)
+        if matches is None:
+            start = 0 if after is None else self._order_index(after)
+            return self._order[start:start + count].tolist()
+        if after is not None:
+            matches = [position for position in matches if self._order_key(position) > after]
+        return heapq.nsmallest(count, matches, key=self._order_key)
+
+    @staticmethod
+    def _cursor_key(cursor):
+        """(created_us, id) key of a listing cursor. Raises ValueError for invalid cursors."""
+        if not cursor:
+            return None
+        created_at, id = decode_cursor(cursor)
+        return to_micros(created_at), id_bytes(id)
+
+    def client_page(self, name, cursor, limit):
+        """Page of clients matching name in (created_at, id) order after cursor, and the next cursor."""
+        after = self._cursor_key(cursor)
+        with self._lock:
+            clients = [self._client_json(p) for p in self._positions_after(name, after, limit + 1)]
+        if len(clients) > limit:
+            clients = clients[:limit]
+            return clients, encode_cursor(clients[-1]['created_at'], clients[-1]['id'])
+        return clients, None
+
+    def stream_clients(self, name, cursor):
+        """Batches of every client client_page() would return from cursor on."""
+        after = self._cursor_key(cursor)
+
+        def batches(after):
+            while True:
+                with self._lock:
+                    positions = self._positions_after(name, after, STREAM_BATCH_SIZE)
+                    clients = [self._client_json(position) for position in positions]
+                    if positions:
+                        after = self._order_key(positions[-1])
+                if not clients:
+                    return
+                yield clients
+        return batches(after)
+
+    # Enrollments
+
+    def _enrollments(self, client):
+        """Edges of a client's enrollments, oldest first."""
+        edges = []
+        edge = self.first_enrollment[client]
+        while edge != NO_EDGE:
+            edges.append(edge)
+            edge = self.next_enrollment[edge]
+        edges.reverse()
+        return edges
+
+    def _enroll(self, client, program, now):
+        for edge in self._enrollments(client):
+            if self.edge_program[edge] == program:
+                return False
+        edge = len(self.edge_program)
+        self.edge_client.append(client)
+        self.edge_program.append(program)
+        self.next_enrollment.append(self.first_enrollment[client])
+        self.first_enrollment[client] = edge
+        self.versions[client] += 1
+        birth_date = date.fromordinal(self.birth_dates[client]).isoformat()
+        self.program_counts[program][(GENDERS[self.genders[client]], birth_bucket(birth_date))] += 1
+        self._record(ENROLLMENT, edge, now)
+        return True
+
+    def _enroll_many(self, ids, position_of, enroll):
+        now = to_micros(datetime.utcnow())
+        enrolled, already_enrolled, not_found = [], [], []
+        with self._lock:
+            for id in dict.fromkeys(ids):
+                position = position_of(id)
+                if position is None:
+                    not_found.append(id)
+                elif enroll(position, now):
+                    enrolled.append(id)
+                else:
+                    already_enrolled.append(id)
+            if enrolled:
+                self._changed.notify_all()
+        return {'enrolled': enrolled, 'already_enrolled': already_enrolled, 'not_found': not_found}
+
+    def enroll_programs(self, client_id, program_ids):
+        """Enroll one client in many programs, reporting each id like the SQL backend."""
+        client = self._client_position(client_id)
+        return self._enroll_many(
+            program_ids, self.program_positions.get, lambda program, now: self._enroll(client, program, now)
+        )
+
+    def enroll_clients(self, program_id, client_ids):
+        """Enroll many clients in one program."""
+        program = self.program_positions[program_id]
+        return self._enroll_many(
+            client_ids, self._client_position, lambda client, now: self._enroll(client, program, now)
+        )
+
+    def enrolled_program_names(self, client_id):
+        with self._lock:
+            client = self._client_position(client_id)
+            return [self.programs[self.edge_program[edge]].name for edge in self._enrollments(client)]
+
+    # Profiles
+
+    def _profile(self, position):
+        profile = self._client_json(position)
+        profile['version'] = self.versions[position]
+        profile['enrolled_programs'] = [
+            {'id': program.id, 'name': program.name, 'description': program.description}
+            for program in (self.programs[self.edge_program[edge]] for edge in self._enrollments(position))
+        ]
+        return profile
+
+    def get_profiles(self, client_ids):
+        """Profiles for client_ids, in order; unknown ids map to None."""
+        with self._lock:
+            positions = [self._client_position(client_id) for client_id in client_ids]
+            return [None if position is None else self._profile(position) for position in positions]
+
+    # Change log
+
+    def _change_json(self, index):
+        entity = self.change_entities[index]
+        position = self.change_positions[index]
+        if entity == CLIENT:
+            entity_id = id_text(self.client_positions.id(position))
+        elif entity == PROGRAM:
+            entity_id = self.programs[position].id
+        else:
+            entity_id = enrollment_id(
+                id_text(self.client_positions.id(self.edge_client[position])),
+                self.programs[self.edge_program[position]].id
+            )
+        return {
+            'id': index + 1,
+            'entity': ENTITIES[entity],
+            'entity_id': entity_id,
+            'op': 'create',
+            'created_at': from_micros(self.change_created[index])
+        }
+
+    def wait_for_changes(self, positions, limit, timeout):
+        """Up to limit changes after positions, waiting up to timeout seconds while there are none."""
+        since = positions[0]
+        with self._changed:
+            self._changed.wait_for(lambda: self.writes > since, timeout=timeout)
+            end = min(self.writes, since + limit)
+            changes = [self._change_json(index) for index in range(since, end)]
+        return changes, [end if changes else since]
+
+    # Snapshots
+
+    def snapshot(self, path):
+        """
+        Write the store to path as packed columns, with names and dates of
+        birth encrypted. Only the columns that change in place are copied
+        under the lock; the rest only grow, so their first entries are read
+        afterwards. Sections are written one at a time with the header last,
+        so the store's size is never held twice in memory. The file is
+        written beside path and renamed into place, so a crash never leaves
+        a partial snapshot.
+
+        Returns:
+            int: The value of writes the snapshot reflects
+        """
+        with self._lock:
+            writes = self.writes
+            clients = self.client_count
+            edges = len(self.edge_program)
+            programs = list(self.programs)
+            counts = [sorted(counter.items()) for counter in self.program_counts]
+            tokens = list(self.tokens)
+            copies = {
+                'client_slots': self.client_positions.slots.tobytes(),
+                'versions': self.versions.tobytes(),
+                'first_enrollment': self.first_enrollment.tobytes(),
+                'order': self._order.tobytes(),
+                'order_keys': self._order_keys.tobytes()
+            }
+        names_end = self.name_ends[clients - 1] if clients else 0
+        token_offsets = array('I', [0])
+
+        def postings():
+            # Postings are appended in position order, so clients registered
+            # after the lock was released are cut off the end
+            for token in tokens:
+                positions = self.tokens[token]
+                kept = positions[:bisect.bisect_left(positions, clients)]
+                token_offsets.append(token_offsets[-1] + len(kept))
+                yield kept.tobytes()
+
+        sections = {}
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+
+            def write(name, chunks):
+                start = f.tell()
+                for chunk in chunks:
+                    f.write(chunk)
+                length = f.tell() - start
+                f.write(b'\0' * (-length % 8))
+                sections[name] = [start, length]
+
+            for name, data in copies.items():
+                write(name, [data])
+            del copies
+            write('client_ids', [self.client_ids[:clients * 16]])
+            write('names', [cipher.encrypt(bytes(self.names[:names_end]))])
+            write('birth_dates', [cipher.encrypt(self.birth_dates[:clients].tobytes())])
+            for name, end in (
+                ('name_ends', clients), ('genders', clients), ('created', clients), ('edge_client', edges),
+                ('edge_program', edges), ('next_enrollment', edges), ('change_entities', writes),
+                ('change_positions', writes), ('change_created', writes)
+            ):
+                write(name, [getattr(self, name)[:end].tobytes()])
+            # Blind indexes are 32 hex digits
+            write('tokens', (bytes.fromhex(token) for token in tokens))
+            write('token_postings', postings())
+            write('token_offsets', [token_offsets.tobytes()])
+
+            header = json.dumps({
+                'byteorder': sys.byteorder,
+                'programs': [[p.id, p.name, p.description, p.created_us] for p in programs],
+                'program_counts': [[[*key, count] for key, count in program_counts] for program_counts in counts],
+                'sections': sections
+            }).encode()
+            f.write(header + struct.pack('<Q', len(header)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return writes
+
+    @classmethod
+    def restore(cls, path):
+        """
+        Load a store written by snapshot(). Each section is read straight
+        into its array, since the store keeps appending to them.
+
+        Raises:
+            ValueError: If path is not a snapshot from this host's byte order
+            cryptography.fernet.InvalidToken: If no current key encrypted it
+        """
+        store = cls()
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f'{path} is not a store snapshot')
+            f.seek(-8, os.SEEK_END)
+            (header_length,) = struct.unpack('<Q', f.read(8))
+            f.seek(-8 - header_length, os.SEEK_END)
+            header = json.loads(f.read(header_length))
+            if header['byteorder'] != sys.byteorder:
+                raise ValueError(f'{path} was written on a {header["byteorder"]}-endian host')
+
+            def section(name):
+                offset, length = header['sections'][name]
+                f.seek(offset)
+                data = f.read(length)
+                return cipher.decrypt(data) if name in ENCRYPTED_SECTIONS else data
+
+            def numbers(name, typecode):
+                values = array(typecode)
+                if name in ENCRYPTED_SECTIONS:
+                    values.frombytes(section(name))
+                else:
+                    offset, length = header['sections'][name]
+                    f.seek(offset)
+                    values.fromfile(f, length // values.itemsize)
+                return values
+
+            store.client_ids = bytearray(section('client_ids'))
+            store.client_positions = IdIndex(store.client_ids, numbers('client_slots', 'i'))
+            store.names = bytearray(section('names'))
+            for name, typecode in (
+                ('name_ends', 'Q'), ('birth_dates', 'i'), ('genders', 'B'), ('created', 'q'),
+                ('versions', 'I'), ('first_enrollment', 'i'), ('edge_client', 'I'), ('edge_program', 'I'),
+                ('next_enrollment', 'i'), ('change_entities', 'B'), ('change_positions', 'I'),
+                ('change_created', 'q')
+            ):
+                setattr(store, name, numbers(name, typecode))
+            store._order = numbers('order', 'I')
+            store._order_keys = numbers('order_keys', 'q')
+
+            store.programs = [Program(*fields) for fields in header['programs']]
+            store.program_positions = {p.id: i for i, p in enumerate(store.programs)}
+            store.program_counts = [
+                Counter({(gender, bucket): count for gender, bucket, count in program_counts})
+                for program_counts in header['program_counts']
+            ]
+            tokens = section('tokens')
+            store.tokens = dict(zip(
+                (tokens[i:i + 16].hex() for i in range(0, len(tokens), 16)),
+                unpack_adjacency(numbers('token_offsets', 'I'), numbers('token_postings', 'I'))
+            ))
+        return store
+
+
+def unpack_adjacency(offsets, values):
+    """Split values into one array per consecutive pair of offsets (CSR layout)."""
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+class Snapshotter:
+    """
+    Saves store to path every interval seconds while it has changed, and
+    once more on exit. SIGTERM, which service managers send to stop a
+    process, is turned into SystemExit so the exit snapshot runs for it too.
+    """
+
+    def __init__(self, store, path, interval):
+        self.store = store
+        self.path = path
+        self.interval = interval
+        self.saved_writes = store.writes
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        atexit.register(self.stop)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._terminate)
+        if self.interval > 0:
+            threading.Thread(target=self._run, name='his-snapshot', daemon=True).start()
+
+    @staticmethod
+    def _terminate(signum, frame):
+        raise SystemExit(128 + signum)
+
+    def save(self):
+        with self._lock:
+            if self.store.writes != self.saved_writes:
+                self.saved_writes = self.store.snapshot(self.path)
+
+    def stop(self):
+        atexit.unregister(self.stop)
+        self._stopped.set()
+        self.save()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.save()
+            except OSError:
+                logger.exception('Could not write snapshot to %s', self.path)
+
+def open_memory_store(app):
+    """
+    The app's MemoryStore, restored from MEMORY_SNAPSHOT_PATH if that file
+    exists. With a path set, the store is saved there every
+    MEMORY_SNAPSHOT_INTERVAL seconds (0 disables) and on exit.
+    """
+    path = app.config.get('MEMORY_SNAPSHOT_PATH')
+    if path and os.path.exists(path):
+        store = MemoryStore.restore(path)
+    else:
+        store = MemoryStore()
+    if path:
+        snapshotter = app.extensions['his_snapshotter'] = Snapshotter(
+            store, path, app.config.get('MEMORY_SNAPSHOT_INTERVAL', 60)
+        )
+        snapshotter.start()
+    return store
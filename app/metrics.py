@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class EndpointStats:
+    __slots__ = ('buckets', 'count', 'seconds', 'sql_count', 'sql_seconds',
+                 'crypto_seconds', 'response_bytes')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.crypto_seconds = 0.0
+        self.response_bytes = 0
+
+class Metrics:
+    """
+    Per-endpoint request latency, SQL, crypto and response size counters,
+    rendered in the Prometheus text format. Counters are per process.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self.caches = {}
+        self.slow_request_seconds = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Must run inside an app context so the engines can be instrumented."""
+        slow_ms = app.config.get('SLOW_REQUEST_MS')
+        self.slow_request_seconds = slow_ms / 1000 if slow_ms else None
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        # Teardown runs for every request, including ones that end in an
+        # unhandled exception or whose after_request hooks fail
+        app.teardown_request(self._teardown_request)
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def register_cache(self, name, stats):
+        """stats is a callable returning a dict with 'hits' and 'misses'."""
+        self.caches[name] = stats
+
+    @contextmanager
+    def crypto_timer(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if has_request_context() and 'metrics_start' in g:
+                g.metrics_crypto += time.perf_counter() - start
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_seconds = 0.0
+        g.metrics_crypto = 0.0
+        g.metrics_queries = [] if self.slow_request_seconds else None
+
+    def _after_request(self, response):
+        if 'metrics_start' in g and not response.is_streamed:
+            g.metrics_response_bytes = response.content_length
+        return response
+
+    def _teardown_request(self, exc):
+        if 'metrics_start' not in g:
+            return
+        elapsed = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or 'unmatched'
+        size = g.get('metrics_response_bytes')
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    stats.buckets[i] += 1
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.sql_count += g.metrics_sql_count
+            stats.sql_seconds += g.metrics_sql_seconds
+            stats.crypto_seconds += g.metrics_crypto
+            stats.response_bytes += size or 0
+        if self.slow_request_seconds and elapsed >= self.slow_request_seconds:
+            logger.warning(
+                'Slow request %s %s took %.1f ms with %d queries:\n%s',
+                request.method, request.path, elapsed * 1000, g.metrics_sql_count,
+                '\n'.join(f'  {seconds * 1000:.2f} ms  {statement}'
+                          for statement, seconds in g.metrics_queries)
+            )
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        if has_request_context() and 'metrics_start' in g:
+            g.metrics_sql_count += 1
+            g.metrics_sql_seconds += elapsed
+            if g.metrics_queries is not None:
+                g.metrics_queries.append((statement, elapsed))
+
+    def render(self):
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            lines = [
+                '# HELP his_request_duration_seconds Request latency by endpoint.',
+                '# TYPE his_request_duration_seconds histogram'
+            ]
+            for endpoint, stats in endpoints:
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    lines.append(f'his_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'his_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {stats.count}')
+                lines.append(f'his_request_duration_seconds_sum{{endpoint="{endpoint}"}} {stats.seconds}')
+                lines.append(f'his_request_duration_seconds_count{{endpoint="{endpoint}"}} {stats.count}')
+            for name, attribute, help in (
+                ('his_sql_queries_total', 'sql_count', 'SQL statements executed.'),
+                ('his_sql_seconds_total', 'sql_seconds', 'Time spent executing SQL.'),
+                ('his_crypto_seconds_total', 'crypto_seconds', 'Time spent encrypting and decrypting fields.'),
+                ('his_response_bytes_total', 'response_bytes', 'Bytes sent in non-streamed response bodies.')
+            ):
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} counter')
+                for endpoint, stats in endpoints:
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {getattr(stats, attribute)}')
+
+        caches = {name: stats() for name, stats in self.caches.items()}
+        for name, help in (('hits', 'Cache hits.'), ('misses', 'Cache misses.')):
+            lines.append(f'# HELP his_cache_{name}_total {help}')
+            lines.append(f'# TYPE his_cache_{name}_total counter')
+            for cache, stats in sorted(caches.items()):
+                lines.append(f'his_cache_{name}_total{{cache="{cache}"}} {stats[name]}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
@@ -1,26 +1,160 @@
 from flask_sqlalchemy import SQLAlchemy
-import uuid
+from sqlalchemy import inspect, text
 from datetime import datetime
+from ids import Identifier, id_bytes, id_text, new_id
+from sharding import ShardedSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ShardedSession})
 
 # models for Program
 class Program(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    __table_args__ = (
+        db.Index('ix_program_created_at_id', 'created_at', 'id'),
+    )
+    id = db.Column(Identifier, primary_key=True, default=new_id)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # bumped on every change; drives ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
 # models for Client
 class Client(db.Model):
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    __table_args__ = (
+        # keyset pagination orders by (created_at, id)
+        db.Index('ix_client_created_at_id', 'created_at', 'id'),
+    )
+    id = db.Column(Identifier, primary_key=True, default=new_id)
     name = db.Column(db.String(200), nullable=False)  # Store encrypted
     date_of_birth = db.Column(db.String(100), nullable=False)  # Store encrypted
     gender = db.Column(db.String(10), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # bumped with updated_at whenever the client or its enrollments change; drives ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime)
+    # first year of the birth decade, kept in clear for aggregate statistics only
+    birth_bucket = db.Column(db.Integer)
     enrolled_programs = db.relationship('Program', secondary='enrollment')
 
+# blind index of client names; token is a keyed HMAC of a name term
+class ClientSearchToken(db.Model):
+    __tablename__ = 'client_search_token'
+    # Rows are only ever reached through the primary key, so SQLite keeps
+    # them in that index alone instead of in a rowid table as well
+    __table_args__ = {'sqlite_with_rowid': False}
+    token = db.Column(db.String(32), primary_key=True)
+    client_id = db.Column(Identifier, db.ForeignKey('client.id'), primary_key=True)
+
 enrollment = db.Table('enrollment',
-    db.Column('client_id', db.String(36), db.ForeignKey('client.id')),
-    db.Column('program_id', db.String(36), db.ForeignKey('program.id'))
-)
\ No newline at end of file
+    db.Column('client_id', Identifier, db.ForeignKey('client.id')),
+    db.Column('program_id', Identifier, db.ForeignKey('program.id')),
+    db.Column('created_at', db.DateTime, default=datetime.utcnow),
+    # The unique index also serves lookups by client_id, its leading column
+    db.Index('ix_enrollment_client_program', 'client_id', 'program_id', unique=True),
+    db.Index('ix_enrollment_program_id', 'program_id')
+)
+
+# enrollment counters per program, gender and birth decade (0 when unknown)
+class ProgramStat(db.Model):
+    __tablename__ = 'program_stat'
+    program_id = db.Column(Identifier, db.ForeignKey('program.id'), primary_key=True)
+    gender = db.Column(db.String(10), primary_key=True)
+    birth_bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+# append-only log of writes, read by downstream sync through /changes
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    # AUTOINCREMENT so ids are never reused and always grow
+    __table_args__ = (
+        # Newest change per entity, for catalogue_generation()
+        db.Index('ix_change_log_entity_id', 'entity', 'id'),
+        {'sqlite_autoincrement': True}
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # client, program or enrollment
+    entity_id = db.Column(db.String(80), nullable=False)  # enrollment: client_id:program_id
+    op = db.Column(db.String(10), nullable=False)  # create, update or delete
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# API tokens; only the SHA-256 digest of each token is stored
+class ApiToken(db.Model):
+    __tablename__ = 'api_token'
+    id = db.Column(db.Integer, primary_key=True)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    principal = db.Column(db.String(80), nullable=False)  # who the token was issued to
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    revoked_at = db.Column(db.DateTime)
+
+def ensure_schema(engine=None, tables=None):
+    """
+    Create missing tables, then add columns and indexes missing from tables
+    that already exist, which create_all() skips. New columns need a server
+    default or to be nullable.
+
+    Args:
+        engine: Defaults to the primary database
+        tables: Defaults to every table
+    """
+    engine = engine or db.engine
+    tables = tables or db.metadata.sorted_tables
+    db.metadata.create_all(engine, tables=tables)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'
+                if column.server_default is not None:
+                    ddl += f' DEFAULT {column.server_default.arg}'
+                    if not column.nullable:
+                        ddl += ' NOT NULL'
+                conn.execute(text(ddl))
+    for table in tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def migrate_ids(binary=True, engine=None, tables=None):
+    """
+    Rewrite every Identifier column in place, from text to 16-byte blobs or
+    back. Only values not yet converted are touched, so an interrupted run
+    can simply be repeated. SQLite only.
+
+    Args:
+        engine: Defaults to the primary database
+        tables: Defaults to every table
+
+    Returns:
+        dict: Rows converted per table.column
+    """
+    engine = engine or db.engine
+    if engine.dialect.name != 'sqlite':
+        raise ValueError('migrate-ids only supports SQLite databases')
+    convert, stored_as = (id_bytes, 'text') if binary else (id_text, 'blob')
+    counts = {}
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+    (foreign_keys,) = cursor.execute('PRAGMA foreign_keys').fetchone()
+    try:
+        # Parents are rewritten before their children, so references
+        # only line up again once every column is converted
+        cursor.execute('PRAGMA foreign_keys = OFF')
+        connection.create_function('his_convert_id', 1, convert, deterministic=True)
+        for table in tables or db.metadata.sorted_tables:
+            for column in table.columns:
+                if isinstance(column.type, Identifier):
+                    cursor.execute(
+                        f'UPDATE {table.name} SET {column.name} = his_convert_id({column.name}) '
+                        f'WHERE typeof({column.name}) = ?', (stored_as,)
+                    )
+                    counts[f'{table.name}.{column.name}'] = cursor.rowcount
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+        connection.close()
+    return counts
@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+from flask import request, url_for
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+def encode_cursor(created_at, id):
+    raw = json.dumps([created_at.isoformat(), id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Raises ValueError for cursors this module did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), id
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def page_limit(args):
+    """Page size from the query string args, clamped to MAX_LIMIT."""
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+def keyset(query, created_column, id_column, cursor=None):
+    """Order query by (created_at, id) and start it after cursor."""
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        query = query.where(or_(
+            created_column > created_at,
+            and_(created_column == created_at, id_column > id)
+        ))
+    return query.order_by(created_column, id_column)
+
+def next_page_headers(response, next_cursor):
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, **request.view_args, **args)}>; rel="next"'
+    return response
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+import time
+from serialization import dumps, loads
+
+class FlaskCacheBackend:
+    """Stores profiles in the app's Flask-Caching cache (shared if CACHE_TYPE is)."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def get_many(self, keys):
+        return dict(zip(keys, self.cache.get_many(*keys)))
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, timeout=ttl)
+
+    def set_many(self, items, ttl):
+        self.cache.set_many(items, timeout=ttl)
+
+    def delete_many(self, keys):
+        self.cache.delete_many(*keys)
+
+    def clear(self):
+        self.cache.clear()
+
+class SQLiteBackend:
+    """Stores profiles in a local SQLite file shared by every worker on the host."""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS profile_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM profile_cache WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return loads(row[0]) if row else None
+
+    def get_many(self, keys):
+        conn = self._connect()
+        now = time.time()
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            found.update(
+                (key, loads(value)) for key, value in conn.execute(
+                    f'SELECT key, value FROM profile_cache WHERE key IN ({",".join("?" * len(chunk))}) '
+                    'AND expires > ?', (*chunk, now)
+                )
+            )
+        return found
+
+    def set(self, key, value, ttl):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl):
+        conn = self._connect()
+        now = time.time()
+        conn.executemany(
+            'INSERT OR REPLACE INTO profile_cache (key, value, expires) VALUES (?, ?, ?)',
+            [(key, dumps(value), now + ttl) for key, value in items.items()]
+        )
+        self._writes += len(items)
+        if self._writes >= self.PURGE_EVERY:
+            self._writes = 0
+            conn.execute('DELETE FROM profile_cache WHERE expires <= ?', (now,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM profile_cache')
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        conn = self._connect()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            conn.execute(
+                f'DELETE FROM profile_cache WHERE key IN ({",".join("?" * len(chunk))})', chunk
+            )
+
+class ProfileCache:
+    """
+    Client profile cache with explicit per-client keys. Writers call set()
+    or invalidate() so cached profiles never outlive the data they were
+    built from, which allows long TTLs.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, cache):
+        self.ttl = app.config.get('PROFILE_CACHE_TTL', self.ttl)
+        backend = app.config.get('PROFILE_CACHE_BACKEND', 'sqlite')
+        if backend == 'sqlite':
+            path = app.config.get('PROFILE_CACHE_PATH') or os.path.join(app.instance_path, 'profile_cache.db')
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.backend = SQLiteBackend(path)
+        elif backend == 'cache':
+            self.backend = FlaskCacheBackend(cache)
+        else:
+            raise ValueError(f'Unknown PROFILE_CACHE_BACKEND: {backend}')
+
+    @staticmethod
+    def key(client_id):
+        return f'profile:{client_id}'
+
+    def get(self, client_id):
+        value = self.backend.get(self.key(client_id))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def get_many(self, client_ids):
+        """Cached profiles by client id; misses are left out."""
+        found = self.backend.get_many([self.key(client_id) for client_id in client_ids])
+        profiles = {}
+        for client_id in client_ids:
+            value = found.get(self.key(client_id))
+            if value is not None:
+                profiles[client_id] = value
+        with self._lock:
+            self.hits += len(profiles)
+            self.misses += len(client_ids) - len(profiles)
+        return profiles
+
+    def set(self, client_id, profile):
+        self.backend.set(self.key(client_id), profile, self.ttl)
+
+    def set_many(self, profiles):
+        if profiles:
+            self.backend.set_many(
+                {self.key(client_id): profile for client_id, profile in profiles.items()}, self.ttl
+            )
+
+    def invalidate(self, client_id):
+        self.invalidate_many([client_id])
+
+    def invalidate_many(self, client_ids):
+        self.backend.delete_many([self.key(client_id) for client_id in client_ids])
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+profile_cache = ProfileCache()
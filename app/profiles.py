@@ -0,0 +1,125 @@
+from operator import itemgetter
+from sqlalchemy import select
+from models import db, Client, Program, enrollment
+from decryption import decryptor
+from profile_cache import profile_cache
+from serialization import row_serializer
+from sharding import shards
+
+# Client ids per joined query
+CHUNK_SIZE = 500
+
+# name and date_of_birth stay encrypted so cache backends never hold plaintext
+profile_fields = row_serializer(
+    'id', 'name', 'date_of_birth', 'gender', 'version', 'created_at', getter=itemgetter
+)
+enrolled_program = row_serializer('id', 'name', 'description', getter=itemgetter)
+# the same shape from a profile_query() row
+joined_program = row_serializer(
+    getter=itemgetter, id='program_id', name='program_name', description='program_description'
+)
+
+def client_profile(client, programs):
+    profile = profile_fields(client)
+    profile['enrolled_programs'] = [enrolled_program(p) for p in programs]
+    return profile
+
+def profile_query(client_ids):
+    """Joined select of clients in client_ids with one row per enrolled program."""
+    return (
+        select(
+            Client.id, Client.name, Client.date_of_birth, Client.gender, Client.created_at,
+            Client.version,
+            Program.id.label('program_id'),
+            Program.name.label('program_name'),
+            Program.description.label('program_description')
+        )
+        .select_from(Client.__table__)
+        .outerjoin(enrollment, enrollment.c.client_id == Client.id)
+        .outerjoin(Program.__table__, Program.id == enrollment.c.program_id)
+        .where(Client.id.in_(client_ids))
+    )
+
+def collect_profiles(profiles, rows):
+    """Fold profile_query() mapping rows into profiles, keyed by client id."""
+    for row in rows:
+        profile = profiles.get(row['id'])
+        if profile is None:
+            profile = profiles[row['id']] = client_profile(row, [])
+        if row['program_id'] is not None:
+            profile['enrolled_programs'].append(joined_program(row))
+    return profiles
+
+def load_profiles(client_ids):
+    """
+    Build profiles for client_ids from the database with one joined query
+    per CHUNK_SIZE ids. Unknown ids are left out of the returned dict.
+    """
+    profiles = {}
+    for shard, ids in shards.group(client_ids).items():
+        with shards.on_shard(shard):
+            for i in range(0, len(ids), CHUNK_SIZE):
+                collect_profiles(profiles, db.session.execute(profile_query(ids[i:i + CHUNK_SIZE])).mappings())
+    return profiles
+
+def client_version(client_id):
+    """Current version of a client, or None if it does not exist."""
+    with shards.for_client(client_id):
+        return db.session.execute(select(Client.version).where(Client.id == client_id)).scalar()
+
+def committed_versions(client_ids):
+    """
+    Versions of client_ids as last committed, read on fresh connections so
+    the session's open read transaction cannot hide newer writes.
+    """
+    versions = {}
+    for shard, ids in shards.group(client_ids).items():
+        with shards.engine(shard).connect() as conn:
+            for i in range(0, len(ids), CHUNK_SIZE):
+                versions.update(conn.execute(
+                    select(Client.id, Client.version).where(Client.id.in_(ids[i:i + CHUNK_SIZE]))
+                ).all())
+    return versions
+
+def cache_profiles(profiles):
+    """
+    Store freshly loaded profiles. A write that commits and invalidates
+    between the load and this set would otherwise be undone, so versions
+    are read again afterwards and entries already out of date are dropped.
+    """
+    if not profiles:
+        return
+    profile_cache.set_many(profiles)
+    versions = committed_versions(list(profiles))
+    stale = [client_id for client_id, profile in profiles.items() if versions.get(client_id) != profile['version']]
+    if stale:
+        profile_cache.invalidate_many(stale)
+
+def profile_etag(client_id, version):
+    return f'{client_id}.{version}'
+
+def decrypt_profiles(client_ids, profiles):
+    """Decrypt cached-form profiles in one batch; returns them in client_ids order."""
+    found = [profiles[client_id] for client_id in client_ids if profiles.get(client_id)]
+    plaintexts = iter(decryptor.decrypt_many(
+        [value for profile in found for value in (profile['name'], profile['date_of_birth'])]
+    ))
+    decrypted = {
+        profile['id']: dict(profile, name=next(plaintexts), date_of_birth=next(plaintexts))
+        for profile in found
+    }
+    return [decrypted.get(client_id) for client_id in client_ids]
+
+def get_profiles(client_ids):
+    """
+    Decrypted profiles for client_ids, in order, from the profile cache or
+    the database. Unknown ids map to None.
+    """
+    client_ids = list(dict.fromkeys(client_ids))
+    profiles = profile_cache.get_many(client_ids)
+    missing = [client_id for client_id in client_ids if profiles.get(client_id) is None]
+    if missing:
+        loaded = load_profiles(missing)
+        cache_profiles(loaded)
+        profiles.update(loaded)
+    return decrypt_profiles(client_ids, profiles)
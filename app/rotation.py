@@ -0,0 +1,91 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import bindparam, select, update
+from models import db, Client
+from sharding import shards
+from utils import cipher
+
+def rotate_values(values):
+    # Runs in pool processes, which load the same keys as the parent
+    return [cipher.rotate(value.encode()).decode() for value in values]
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'shard': 0, 'last_id': None, 'rows': 0}
+
+def save_checkpoint(path, checkpoint):
+    if not path:
+        return
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+def rotate_client_keys(chunk_size=1000, workers=None, max_rate=0, checkpoint_path=None, report=print):
+    """
+    Re-encrypt every client's name and date_of_birth under the newest key.
+
+    Clients are read shard by shard in primary-key order, chunk_size rows at a time. Each
+    chunk is re-encrypted on a process pool and written back in its own
+    short transaction, then the checkpoint is saved. An interrupted run
+    resumes after the last committed chunk. max_rate (rows per second, 0
+    for unlimited) throttles the job so live writers keep getting the lock.
+
+    Returns:
+        int: Rows re-encrypted by this run
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    statement = (
+        update(Client.__table__)
+        .where(Client.__table__.c.id == bindparam('b_id'))
+        .values(name=bindparam('b_name'), date_of_birth=bindparam('b_date_of_birth'))
+    )
+    workers = workers or os.cpu_count() or 1
+    started = time.monotonic()
+    rotated = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            shard = checkpoint.get('shard', 0)
+            if shard >= shards.count:
+                break
+            query = select(Client.id, Client.name, Client.date_of_birth).order_by(Client.id).limit(chunk_size)
+            if checkpoint['last_id'] is not None:
+                query = query.where(Client.id > checkpoint['last_id'])
+            with shards.on_shard(shard):
+                rows = db.session.execute(query).all()
+            if not rows:
+                # Shard done; carry on with the next one
+                checkpoint = {'shard': shard + 1, 'last_id': None, 'rows': checkpoint['rows']}
+                save_checkpoint(checkpoint_path, checkpoint)
+                continue
+
+            per_worker = -(-len(rows) // workers)
+            parts = [
+                [value for row in rows[i:i + per_worker] for value in (row.name, row.date_of_birth)]
+                for i in range(0, len(rows), per_worker)
+            ]
+            ciphertexts = iter([value for part in pool.map(rotate_values, parts) for value in part])
+            with shards.on_shard(shard):
+                db.session.execute(statement, [
+                    {'b_id': row.id, 'b_name': next(ciphertexts), 'b_date_of_birth': next(ciphertexts)}
+                    for row in rows
+                ])
+            db.session.commit()
+
+            rotated += len(rows)
+            checkpoint = {'shard': shard, 'last_id': rows[-1].id, 'rows': checkpoint['rows'] + len(rows)}
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.monotonic() - started
+            if max_rate:
+                ahead = rotated / max_rate - elapsed
+                if ahead > 0:
+                    time.sleep(ahead)
+                    elapsed += ahead
+            report(f'{checkpoint["rows"]} rows re-encrypted ({rotated / elapsed:.0f} rows/s)')
+    return rotated
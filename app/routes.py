@@ -1,24 +1,45 @@
-from flask import jsonify, request
+from flask import Response, jsonify, make_response, request, stream_with_context
 from flasgger import swag_from
-from jsonschema import validate, ValidationError
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
 from flask_httpauth import HTTPTokenAuth
-from models import db, Client, Program
-from schemas import PROGRAM_SCHEMA, CLIENT_SCHEMA, ENROLL_SCHEMA
-from utils import encrypt_data, decrypt_data
+from models import db
+from validation import (
+    PROGRAM_VALIDATOR, CLIENT_VALIDATOR, ENROLL_VALIDATOR, PROGRAM_ENROLL_VALIDATOR, PROFILES_VALIDATOR,
+    validate_json, validate_many
+)
+from profile_cache import profile_cache
+from metrics import metrics
+from profiles import profile_etag
+from pagination import next_page_headers, page_limit
+from changes import ARGS_ERROR, format_cursor, parse_changes_args
+from serialization import dumps, loads
+from tokens import api_tokens
 
-executor = ThreadPoolExecutor()
 auth = HTTPTokenAuth(scheme='Bearer')
 
-# Mock API keys (replace with database in production)
-API_KEYS = {'doctor1': 'secret-token-123'}
-
 @auth.verify_token
 def verify_token(token):
-    return token in API_KEYS.values()
+    # The principal becomes auth.current_user()
+    return api_tokens.verify(token)
+
+def not_modified(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    return response
 
-def register_routes(app, cache):
+def iter_bulk_records():
+    # NDJSON bodies are read line by line so large uploads are never held whole
+    if request.mimetype == 'application/x-ndjson':
+        for line in request.stream:
+            if line.strip():
+                yield loads(line)
+    else:
+        data = request.get_json()
+        if not isinstance(data, list):
+            raise ValueError('Expected a JSON array of clients')
+        yield from data
+
+def register_routes(app, store):
+    """Register the API on app, reading and writing through store (see storage.create_store)."""
     @app.route('/programs', methods=['POST'])
     @auth.login_required
     @swag_from({
@@ -43,21 +64,144 @@ def register_routes(app, cache):
             '400': {'description': 'Invalid input'}
         }
     })
-    def create_program():
+    @validate_json(PROGRAM_VALIDATOR)
+    def create_program(data):
+        return jsonify(store.create_program(data['name'], data['description'])), 201
+
+    @app.route('/programs', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Programs'],
+        'parameters': [
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Page size (default 50, max 1000)'
+            },
+            {
+                'name': 'cursor',
+                'in': 'query',
+                'type': 'string',
+                'required': False,
+                'description': 'Opaque cursor from the X-Next-Cursor header of the previous page'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Page of programs ordered by creation time'},
+            '400': {'description': 'Invalid limit or cursor'}
+        }
+    })
+    def list_programs():
         try:
-            data = request.get_json()
-            validate(instance=data, schema=PROGRAM_SCHEMA)
-            program = Program(name=data['name'], description=data['description'])
-            db.session.add(program)
-            db.session.commit()
-            return jsonify({
-                'id': program.id,
-                'name': program.name,
-                'description': program.description,
-                'created_at': program.created_at.isoformat()
-            }), 201
-        except ValidationError as e:
+            programs, next_cursor = store.list_programs(request.args.get('cursor'), page_limit(request.args))
+        except ValueError as e:
             return jsonify({'error': str(e)}), 400
+        return next_page_headers(jsonify(programs), next_cursor)
+
+    @app.route('/programs/search', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Programs'],
+        'parameters': [
+            {
+                'name': 'q',
+                'in': 'query',
+                'type': 'string',
+                'required': True,
+                'description': 'Words to find in program names and descriptions, matched as prefixes'
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Page size (default 50, max 1000)'
+            },
+            {
+                'name': 'offset',
+                'in': 'query',
+                'type': 'integer',
+                'required': False
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Programs ranked by relevance'},
+            '400': {'description': 'Invalid limit or offset'}
+        }
+    })
+    def search_program_catalogue():
+        query = request.args.get('q', '')
+        try:
+            limit = page_limit(request.args)
+            offset = max(int(request.args.get('offset', 0)), 0)
+        except ValueError:
+            return jsonify({'error': 'limit and offset must be integers'}), 400
+        return jsonify(store.search_programs(query, limit, offset))
+
+    @app.route('/programs/stats', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Programs'],
+        'responses': {
+            '200': {'description': 'Enrollment counts for every program by gender and birth decade'}
+        }
+    })
+    def get_all_program_stats():
+        return jsonify(store.all_program_stats())
+
+    @app.route('/programs/<program_id>/stats', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Programs'],
+        'parameters': [
+            {
+                'name': 'program_id',
+                'in': 'path',
+                'type': 'string',
+                'required': True
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Enrollment counts by gender and birth decade'},
+            '404': {'description': 'Program not found'}
+        }
+    })
+    def get_program_stats(program_id):
+        stats = store.program_stats(program_id)
+        if stats is None:
+            return jsonify({'error': 'Program not found'}), 404
+        return jsonify(stats)
+
+    @app.route('/programs/<program_id>', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Programs'],
+        'parameters': [
+            {
+                'name': 'program_id',
+                'in': 'path',
+                'type': 'string',
+                'required': True
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Program'},
+            '304': {'description': 'Not modified since the ETag in If-None-Match'},
+            '404': {'description': 'Program not found'}
+        }
+    })
+    def get_program(program_id):
+        program = store.get_program(program_id)
+        if not program:
+            return jsonify({'error': 'Program not found'}), 404
+        etag = f'{program["id"]}.{program.pop("version")}'
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        response = jsonify(program)
+        response.set_etag(etag)
+        return response
 
     @app.route('/clients', methods=['POST'])
     @auth.login_required
@@ -84,26 +228,76 @@ def register_routes(app, cache):
             '400': {'description': 'Invalid input'}
         }
     })
-    def register_client():
+    @validate_json(CLIENT_VALIDATOR)
+    def register_client(data):
+        return jsonify(store.register_client(data)), 201
+
+    @app.route('/clients/bulk', methods=['POST'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Clients'],
+        'consumes': ['application/json', 'application/x-ndjson'],
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'description': 'JSON array of clients, or one client per line as NDJSON',
+                'schema': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'object',
+                        'properties': {
+                            'name': {'type': 'string', 'example': 'John Doe'},
+                            'date_of_birth': {'type': 'string', 'example': '1990-01-01'},
+                            'gender': {'type': 'string', 'example': 'Male'}
+                        },
+                        'required': ['name', 'date_of_birth', 'gender']
+                    }
+                }
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Per-record registration results'},
+            '400': {'description': 'Malformed body'}
+        }
+    })
+    def register_clients_bulk():
+        chunk_size = app.config.get('BULK_CHUNK_SIZE', 5000)
+        results = []
+        pending = []
+        created = 0
+
+        def flush(start):
+            invalid = dict(validate_many(CLIENT_VALIDATOR, pending))
+            for offset, message in invalid.items():
+                results.append({'index': start + offset, 'error': message})
+            valid = [(start + offset, record) for offset, record in enumerate(pending)
+                     if offset not in invalid]
+            ids = store.register_clients([record for _, record in valid])
+            for (index, _), client_id in zip(valid, ids):
+                results.append({'index': index, 'id': client_id})
+            pending.clear()
+            return len(ids)
+
         try:
-            data = request.get_json()
-            validate(instance=data, schema=CLIENT_SCHEMA)
-            client = Client(
-                name=encrypt_data(data['name']),
-                date_of_birth=encrypt_data(data['date_of_birth']),
-                gender=data['gender']
-            )
-            db.session.add(client)
-            db.session.commit()
-            return jsonify({
-                'id': client.id,
-                'name': data['name'],
-                'date_of_birth': data['date_of_birth'],
-                'gender': client.gender,
-                'created_at': client.created_at.isoformat()
-            }), 201
-        except ValidationError as e:
-            return jsonify({'error': str(e)}), 400
+            start = 0
+            for index, record in enumerate(iter_bulk_records()):
+                pending.append(record)
+                if len(pending) >= chunk_size:
+                    created += flush(start)
+                    start = index + 1
+            created += flush(start)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e), 'created': created, 'results': results}), 400
+
+        results.sort(key=lambda result: result['index'])
+        return jsonify({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        })
 
     @app.route('/clients/<client_id>/enroll', methods=['POST'])
     @auth.login_required
@@ -120,12 +314,13 @@ def register_routes(app, cache):
                 'name': 'body',
                 'in': 'body',
                 'required': True,
+                'description': 'Either one program_id or a list of program_ids',
                 'schema': {
                     'type': 'object',
                     'properties': {
-                        'program_id': {'type': 'string'}
-                    },
-                    'required': ['program_id']
+                        'program_id': {'type': 'string'},
+                        'program_ids': {'type': 'array', 'items': {'type': 'string'}}
+                    }
                 }
             }
         ],
@@ -135,25 +330,121 @@ def register_routes(app, cache):
             '404': {'description': 'Client or Program not found'}
         }
     })
-    def enroll_client(client_id):
+    @validate_json(ENROLL_VALIDATOR)
+    def enroll_client(data, client_id):
+        if not store.client_exists(client_id):
+            return jsonify({'error': 'Client or Program not found'}), 404
+
+        if 'program_ids' in data:
+            result = store.enroll_programs(client_id, data['program_ids'])
+            return jsonify(dict(result, enrolled_programs=store.enrolled_program_names(client_id)))
+
+        program = store.get_program(data['program_id'])
+        if not program:
+            return jsonify({'error': 'Client or Program not found'}), 404
+        
+        store.enroll_programs(client_id, [program['id']])
+
+        return jsonify({
+            'message': f'Client enrolled in {program["name"]}',
+            'enrolled_programs': store.enrolled_program_names(client_id)
+        })
+
+    @app.route('/programs/<program_id>/enroll', methods=['POST'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Programs'],
+        'parameters': [
+            {
+                'name': 'program_id',
+                'in': 'path',
+                'type': 'string',
+                'required': True
+            },
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'client_ids': {'type': 'array', 'items': {'type': 'string'}}
+                    },
+                    'required': ['client_ids']
+                }
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Enrollment counts and unknown client ids'},
+            '400': {'description': 'Invalid input'},
+            '404': {'description': 'Program not found'}
+        }
+    })
+    @validate_json(PROGRAM_ENROLL_VALIDATOR)
+    def enroll_program_clients(data, program_id):
+        if not store.get_program(program_id):
+            return jsonify({'error': 'Program not found'}), 404
+
+        result = store.enroll_clients(program_id, data['client_ids'])
+        return jsonify({
+            'enrolled': len(result['enrolled']),
+            'already_enrolled': len(result['already_enrolled']),
+            'not_found': result['not_found']
+        })
+
+    listing_parameters = [
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Page size (default 50, max 1000)'
+        },
+        {
+            'name': 'cursor',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Opaque cursor from the X-Next-Cursor header of the previous page'
+        },
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['json', 'ndjson'],
+            'required': False,
+            'description': 'ndjson streams every remaining match, one client per line'
+        }
+    ]
+
+    def list_page(name):
+        cursor = request.args.get('cursor')
+        if request.args.get('format') == 'ndjson':
+            return stream_clients(store.stream_clients(name, cursor))
+        results, next_cursor = store.client_page(name, cursor, page_limit(request.args))
+        return next_page_headers(jsonify(results), next_cursor)
+
+    def stream_clients(batches):
+        def generate():
+            for clients in batches:
+                for client in clients:
+                    yield dumps(client) + b'\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    @app.route('/clients', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Clients'],
+        'parameters': listing_parameters,
+        'responses': {
+            '200': {'description': 'Page of clients ordered by registration time'},
+            '400': {'description': 'Invalid limit or cursor'}
+        }
+    })
+    def list_clients():
         try:
-            data = request.get_json()
-            validate(instance=data, schema=ENROLL_SCHEMA)
-            client = Client.query.get(client_id)
-            program = Program.query.get(data['program_id'])
-            
-            if not client or not program:
-                return jsonify({'error': 'Client or Program not found'}), 404
-            
-            if program not in client.enrolled_programs:
-                client.enrolled_programs.append(program)
-                db.session.commit()
-            
-            return jsonify({
-                'message': f'Client enrolled in {program.name}',
-                'enrolled_programs': [p.name for p in client.enrolled_programs]
-            })
-        except ValidationError as e:
+            return list_page('')
+        except ValueError as e:
             return jsonify({'error': str(e)}), 400
 
     @app.route('/clients/search', methods=['GET'])
@@ -167,34 +458,20 @@ def register_routes(app, cache):
                 'type': 'string',
                 'required': False
             }
-        ],
+        ] + listing_parameters,
         'responses': {
-            '200': {'description': 'List of matching clients'}
+            '200': {'description': 'List of matching clients'},
+            '400': {'description': 'Invalid limit or cursor'}
         }
     })
-    async def search_client():
-        name = request.args.get('name', '').lower()
-        
-        async def search():
-            with app.app_context():
-                clients = Client.query.filter(Client.name.ilike(f'%{name}%')).all()
-                return [
-                    {
-                        'id': client.id,
-                        'name': decrypt_data(client.name),
-                        'date_of_birth': decrypt_data(client.date_of_birth),
-                        'gender': client.gender
-                    }
-                    for client in clients
-                ]
-        
-        loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(executor, search)
-        return jsonify(results)
+    def search_client():
+        try:
+            return list_page(request.args.get('name', ''))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
     @app.route('/clients/<client_id>', methods=['GET'])
     @auth.login_required
-    @cache.cached(timeout=60)
     @swag_from({
         'tags': ['Clients'],
         'parameters': [
@@ -207,26 +484,116 @@ def register_routes(app, cache):
         ],
         'responses': {
             '200': {'description': 'Client profile'},
+            '304': {'description': 'Not modified since the ETag in If-None-Match'},
             '404': {'description': 'Client not found'}
         }
     })
     def get_client_profile(client_id):
-        client = Client.query.get(client_id)
-        if not client:
+        # Revalidation only needs the version column: no join, no decryption
+        if request.if_none_match:
+            version = store.client_version(client_id)
+            if version is not None and request.if_none_match.contains(profile_etag(client_id, version)):
+                return not_modified(profile_etag(client_id, version))
+
+        profile = store.get_profiles([client_id])[0]
+        if profile is None:
             return jsonify({'error': 'Client not found'}), 404
-        
-        return jsonify({
-            'id': client.id,
-            'name': decrypt_data(client.name),
-            'date_of_birth': decrypt_data(client.date_of_birth),
-            'gender': client.gender,
-            'enrolled_programs': [
-                {
-                    'id': p.id,
-                    'name': p.name,
-                    'description': p.description
+        response = jsonify(profile)
+        if profile.get('version'):
+            response.set_etag(profile_etag(client_id, profile['version']))
+        return response
+
+    @app.route('/clients/profiles', methods=['POST'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Clients'],
+        'parameters': [
+            {
+                'name': 'body',
+                'in': 'body',
+                'required': True,
+                'schema': {
+                    'type': 'object',
+                    'properties': {
+                        'client_ids': {'type': 'array', 'items': {'type': 'string'}, 'maxItems': 1000}
+                    },
+                    'required': ['client_ids']
                 }
-                for p in client.enrolled_programs
-            ],
-            'created_at': client.created_at.isoformat()
-        })
\ No newline at end of file
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Profiles in request order, plus ids that were not found'},
+            '400': {'description': 'Invalid input'}
+        }
+    })
+    @validate_json(PROFILES_VALIDATOR)
+    def get_client_profiles(data):
+        client_ids = list(dict.fromkeys(data['client_ids']))
+        profiles = store.get_profiles(client_ids)
+        return jsonify({
+            'profiles': [profile for profile in profiles if profile is not None],
+            'not_found': [client_id for client_id, profile in zip(client_ids, profiles) if profile is None]
+        })
+
+    @app.route('/changes', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Sync'],
+        'parameters': [
+            {
+                'name': 'since',
+                'in': 'query',
+                'type': 'string',
+                'required': False,
+                'description': 'Return changes after this cursor (the previous response\'s next); 0 for all. '
+                               'An integer, or with sharding one id per shard joined by dots'
+            },
+            {
+                'name': 'limit',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Page size (default 50, max 1000)'
+            },
+            {
+                'name': 'wait',
+                'in': 'query',
+                'type': 'integer',
+                'required': False,
+                'description': 'Long poll: seconds to wait for a change when there is none (max 30)'
+            }
+        ],
+        'responses': {
+            '200': {'description': 'Changes in commit order and the cursor to resume from'},
+            '400': {'description': 'Invalid since, limit or wait'}
+        }
+    })
+    def get_changes():
+        try:
+            positions, limit, wait = parse_changes_args(request.args)
+        except ValueError:
+            return jsonify({'error': ARGS_ERROR}), 400
+        changes, positions = store.wait_for_changes(positions, limit, wait)
+        return jsonify({'changes': changes, 'next': format_cursor(positions)})
+
+    @app.route('/cache/stats', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Cache'],
+        'responses': {
+            '200': {'description': 'Profile cache hit and miss counters for this worker'}
+        }
+    })
+    def cache_stats():
+        return jsonify({'profiles': profile_cache.stats()})
+
+    @app.route('/metrics', methods=['GET'])
+    @auth.login_required
+    @swag_from({
+        'tags': ['Monitoring'],
+        'responses': {
+            '200': {'description': 'Per-endpoint latency, SQL, crypto, cache and response size metrics in Prometheus text format'}
+        }
+    })
+    def get_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -20,7 +20,24 @@ CLIENT_SCHEMA = {
 ENROLL_SCHEMA = {
     "type": "object",
     "properties": {
-        "program_id": {"type": "string"}
+        "program_id": {"type": "string"},
+        "program_ids": {"type": "array", "items": {"type": "string"}, "minItems": 1}
     },
-    "required": ["program_id"]
-}
\ No newline at end of file
+    "anyOf": [{"required": ["program_id"]}, {"required": ["program_ids"]}]
+}
+
+PROGRAM_ENROLL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "client_ids": {"type": "array", "items": {"type": "string"}, "minItems": 1}
+    },
+    "required": ["client_ids"]
+}
+
+PROFILES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "client_ids": {"type": "array", "items": {"type": "string"}, "minItems": 1, "maxItems": 1000}
+    },
+    "required": ["client_ids"]
+}
@@ -0,0 +1,53 @@
+import re
+import unicodedata
+from sqlalchemy import func, select
+from models import ClientSearchToken
+from utils import blind_index
+
+# Word prefixes shorter than this are only indexed as whole words
+MIN_PREFIX = 2
+# Longer prefixes are not indexed; queries are truncated to this length
+MAX_PREFIX = 10
+
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return re.findall(r'\w+', name.lower())
+
+def name_terms(name):
+    """Terms stored for a client name: each word plus its prefixes."""
+    terms = set()
+    for word in normalize_name(name):
+        terms.add('w:' + word)
+        for i in range(MIN_PREFIX, min(len(word), MAX_PREFIX) + 1):
+            terms.add('p:' + word[:i])
+    return terms
+
+def query_terms(query):
+    """Terms a name must carry to match query; every query word is a prefix."""
+    terms = set()
+    for word in normalize_name(query):
+        if len(word) < MIN_PREFIX:
+            terms.add('w:' + word)
+        else:
+            terms.add('p:' + word[:MAX_PREFIX])
+    return terms
+
+def token_rows(client_id, name):
+    return [{'token': blind_index(term), 'client_id': client_id} for term in name_terms(name)]
+
+def matching_client_ids(query):
+    """
+    Select of client ids whose name matches every word of query, or None
+    when the query has no searchable words.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return None
+    tokens = [blind_index(term) for term in terms]
+    return (
+        select(ClientSearchToken.client_id)
+        .where(ClientSearchToken.token.in_(tokens))
+        .group_by(ClientSearchToken.client_id)
+        .having(func.count(ClientSearchToken.token) == len(tokens))
+    )
@@ -0,0 +1,114 @@
+import gzip
+import json
+from datetime import date, datetime
+from operator import attrgetter
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # stdlib json is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Responses worth compressing; others are small or already compressed
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/csv'}
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+if orjson is not None:
+    def dumps(value):
+        """Encode value as compact JSON bytes. Datetimes become ISO 8601 strings."""
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    def dumps(value):
+        """Encode value as compact JSON bytes. Datetimes become ISO 8601 strings."""
+        return json.dumps(value, separators=(',', ':'), default=_default).encode()
+
+    loads = json.loads
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify() and request.get_json() through dumps() and loads(), so
+    responses are encoded straight to bytes, with orjson when installed.
+    Keys keep their insertion order instead of being sorted.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+def row_serializer(*fields, getter=attrgetter, **sources):
+    """
+    Build a function turning a row into a response dict. fields are read
+    under their own name, each keyword maps an output key to a differently
+    named source. getter is attrgetter for rows and objects, itemgetter for
+    mappings. Datetimes are left for dumps() to encode.
+    """
+    keys = fields + tuple(sources)
+    get = getter(*fields, *sources.values())
+    return lambda row: dict(zip(keys, get(row)))
+
+def preferred_encoding(accept_encoding):
+    """br or gzip if the Accept-Encoding header value allows it, else None."""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        params = params.strip()
+        try:
+            weight = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            weight = 0.0
+        weights[name.strip().lower()] = weight
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if weights.get(encoding, weights.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+def init_compression(app):
+    """
+    Compress JSON, NDJSON and CSV responses of at least COMPRESS_MIN_BYTES
+    with br or gzip. Streamed responses and responses with an ETag are left
+    alone, so revalidation keeps matching the same representation.
+    """
+
+    @app.after_request
+    def compress_response(response):
+        min_bytes = app.config.get('COMPRESS_MIN_BYTES')
+        if (min_bytes is None or response.status_code != 200 or response.is_streamed
+                or response.direct_passthrough or response.mimetype not in COMPRESSIBLE_TYPES
+                or 'Content-Encoding' in response.headers or 'ETag' in response.headers):
+            return response
+        body = response.get_data()
+        if len(body) < min_bytes:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = preferred_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is not None:
+            response.set_data(compress(body, encoding, app.config.get('COMPRESS_LEVEL', 6)))
+            response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,171 @@
+import heapq
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from flask_sqlalchemy.session import Session
+from sqlalchemy import select
+from sqlalchemy.sql.util import find_tables
+
+# Tables partitioned by a hash of the client id. A shard's change_log and
+# program_stat rows describe its own clients, so a client write touches one
+# database only; readers merge them across shards. program is copied to
+# every shard so enrollment checks and profile joins stay on one database.
+# All other tables live only on the primary database, which is also shard 0.
+SHARDED_TABLES = ('client', 'client_search_token', 'enrollment', 'change_log', 'program_stat')
+REPLICATED_TABLES = ('program',)
+SHARD_LOCAL_TABLES = frozenset(SHARDED_TABLES + REPLICATED_TABLES)
+
+_current_shard = ContextVar('his_shard', default=0)
+
+def bind_key(shard):
+    return None if shard == 0 else f'shard{shard}'
+
+def _table_names(mapper, clause):
+    if mapper is not None:
+        return {table.name for table in mapper.tables}
+    if clause is not None:
+        return {table.name for table in find_tables(clause, include_crud=True, include_joins=True)}
+    return set()
+
+class ShardedSession(Session):
+    """Runs statements on shard-local tables on the engine of the current shard."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard = _current_shard.get()
+        if bind is None and shard and SHARD_LOCAL_TABLES.intersection(_table_names(mapper, clause)):
+            return self._db.engines[bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class Shards:
+    """
+    Client data split across SHARD_COUNT SQLite databases, each with its own
+    writer lock. Point operations run inside on_shard() or for_client(), so
+    the session sends client, token, enrollment, change log and counter
+    statements to that shard. Listings run on every shard in parallel and
+    are merged in keyset order. One commit covers every shard the session
+    touched, but is not atomic across them.
+
+    A transaction that writes several shards must write them in ascending
+    shard order, as group() yields them, so two such transactions cannot
+    each hold a lock the other waits for. Programs are written to the
+    primary alone and copied to the other shards after it commits.
+
+    With SHARD_COUNT = 1 (the default) everything runs on the primary
+    database through the request's session, as before.
+    """
+
+    def __init__(self):
+        self.count = 1
+        self.db = None
+        self._pool = None
+
+    def configure(self, app):
+        """Add a bind per extra shard; call before db.init_app()."""
+        self.count = app.config.get('SHARD_COUNT', 1)
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for shard in range(1, self.count):
+            binds.setdefault(bind_key(shard), app.config['SHARD_DATABASE_URI'].format(shard=shard))
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    def init_app(self, app, db):
+        self.db = db
+        if self.enabled:
+            self._pool = ThreadPoolExecutor(max_workers=self.count, thread_name_prefix='shard')
+
+    @property
+    def enabled(self):
+        return self.count > 1
+
+    def shard_for(self, client_id):
+        return zlib.crc32(client_id.encode()) % self.count if self.enabled else 0
+
+    def engine(self, shard):
+        return self.db.engines[bind_key(shard)]
+
+    def local_tables(self):
+        return [self.db.metadata.tables[name] for name in sorted(SHARD_LOCAL_TABLES)]
+
+    def group(self, items, client_id=lambda item: item):
+        """items by shard in ascending shard order, in their original order within each shard."""
+        groups = {}
+        for item in items:
+            groups.setdefault(self.shard_for(client_id(item)), []).append(item)
+        return dict(sorted(groups.items()))
+
+    def single_shard(self, client_ids):
+        """The shard holding every one of client_ids, or None if they span several."""
+        found = {self.shard_for(client_id) for client_id in client_ids}
+        return found.pop() if len(found) == 1 else None
+
+    @contextmanager
+    def on_shard(self, shard):
+        token = _current_shard.set(shard)
+        try:
+            yield
+        finally:
+            _current_shard.reset(token)
+
+    def for_client(self, client_id):
+        return self.on_shard(self.shard_for(client_id))
+
+    def replicate(self, table, rows):
+        """
+        Copy rows of a replicated table, already committed on the primary, to
+        every other shard, each in its own transaction. sync_replicas() at
+        startup fills in any copy a crash left out.
+        """
+        if rows:
+            for shard in range(1, self.count):
+                with self.engine(shard).begin() as conn:
+                    conn.execute(table.insert().prefix_with('OR IGNORE'), rows)
+
+    def sync_replicas(self):
+        """Copy rows of replicated tables missing from a shard, e.g. after raising SHARD_COUNT."""
+        for name in REPLICATED_TABLES:
+            table = self.db.metadata.tables[name]
+            with self.engine(0).connect() as conn:
+                rows = [dict(row._mapping) for row in conn.execute(select(table))]
+            if not rows:
+                continue
+            for shard in range(1, self.count):
+                with self.engine(shard).begin() as conn:
+                    conn.execute(table.insert().prefix_with('OR IGNORE'), rows)
+
+    @staticmethod
+    def _fetch(engine, statement):
+        with engine.connect() as conn:
+            return conn.execute(statement).all()
+
+    def merged(self, statement, key, limit):
+        """
+        The first limit rows of statement across all shards. statement must
+        be ordered by key and limited to limit rows on each shard.
+        """
+        if not self.enabled:
+            return self.db.session.execute(statement).all()
+        # Engines are looked up here: pool threads have no app context
+        engines = [self.engine(shard) for shard in range(self.count)]
+        results = self._pool.map(self._fetch, engines, [statement] * self.count)
+        return list(islice(heapq.merge(*results, key=key), limit))
+
+    def stream_merged(self, statement, key, batch_size):
+        """Every row of statement across all shards, merged by key, in batches of batch_size."""
+        if not self.enabled:
+            yield from self.db.session.execute(statement.execution_options(yield_per=batch_size)).partitions()
+            return
+        with ExitStack() as stack:
+            results = [
+                stack.enter_context(self.engine(shard).connect())
+                .execute(statement.execution_options(yield_per=batch_size))
+                for shard in range(self.count)
+            ]
+            rows = heapq.merge(*results, key=key)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    return
+                yield batch
+
+shards = Shards()
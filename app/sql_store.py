@@ -0,0 +1,115 @@
+"""
+Clients, programs and enrollments in the SQLAlchemy database: the default
+storage behind the routes (STORAGE_BACKEND = 'sql'). Client data is sharded
+per SHARD_COUNT and profiles go through profile_cache. Writes are
+committed before each method returns.
+"""
+from functools import partial
+from models import db, Client, Program
+from batching import write_batcher
+from catalogue import catalogue_generation, program_listing, search_programs, serialize_program
+from changes import record_changes, wait_for_changes
+from clients import STREAM_BATCH_SIZE, client_listing, create_clients, listing_key, serialize_clients, split_page
+from enrollments import enroll_clients, enroll_programs, enrolled_program_names, exists
+from ids import new_id
+from profile_cache import profile_cache
+from profiles import client_profile, client_version, get_profiles
+from sharding import shards
+from stats import all_program_stats, program_stats
+
+class SQLStore:
+    def __init__(self, app, cache):
+        self.cache = cache
+        self.search_cache_ttl = app.config['PROGRAM_SEARCH_CACHE_TTL']
+
+    def create_program(self, name, description):
+        program = Program(name=name, description=description)
+        db.session.add(program)
+        db.session.flush()
+        record_changes('program', 'create', [program.id])
+        row = {column.key: getattr(program, column.key) for column in Program.__table__.columns}
+        db.session.commit()
+        # Only after the primary's commit, so no transaction holds its lock while waiting on a shard
+        shards.replicate(Program.__table__, [row])
+        return serialize_program(program)
+
+    def get_program(self, program_id):
+        program = db.session.get(Program, program_id)
+        return None if program is None else dict(serialize_program(program), version=program.version)
+
+    def list_programs(self, cursor, limit):
+        rows, next_cursor = split_page(db.session.execute(program_listing(cursor).limit(limit + 1)).all(), limit)
+        return [serialize_program(row) for row in rows], next_cursor
+
+    def search_programs(self, query, limit, offset):
+        # Any program write changes the generation, so earlier results are no longer reachable
+        key = f'programs:search:{catalogue_generation()}:{limit}:{offset}:{query}'
+        results = self.cache.get(key)
+        if results is None:
+            results = search_programs(query, limit, offset)
+            self.cache.set(key, results, timeout=self.search_cache_ttl)
+        return results
+
+    def program_stats(self, program_id):
+        return program_stats(program_id) if exists(Program, program_id) else None
+
+    def all_program_stats(self):
+        return all_program_stats()
+
+    def client_exists(self, client_id):
+        return exists(Client, client_id)
+
+    def client_version(self, client_id):
+        return client_version(client_id)
+
+    def register_client(self, data):
+        client_id = new_id()
+        client = write_batcher.run(
+            partial(create_clients, [data], ids=[client_id]), shard=shards.shard_for(client_id)
+        )[0]
+        profile_cache.set(client['id'], client_profile(client, []))
+        return {
+            'id': client['id'],
+            'name': data['name'],
+            'date_of_birth': data['date_of_birth'],
+            'gender': client['gender'],
+            'created_at': client['created_at']
+        }
+
+    def register_clients(self, records):
+        """Register validated records in one transaction; returns their new ids in order."""
+        rows = create_clients(records)
+        db.session.commit()
+        return [row['id'] for row in rows]
+
+    def client_page(self, name, cursor, limit):
+        query = client_listing(name, cursor)
+        rows, next_cursor = split_page(shards.merged(query.limit(limit + 1), listing_key, limit + 1), limit)
+        return serialize_clients(rows), next_cursor
+
+    def stream_clients(self, name, cursor):
+        # Built here so an invalid cursor raises before the response starts
+        query = client_listing(name, cursor)
+        return (serialize_clients(rows) for rows in shards.stream_merged(query, listing_key, STREAM_BATCH_SIZE))
+
+    def enroll_programs(self, client_id, program_ids):
+        result = write_batcher.run(enroll_programs, client_id, program_ids, shard=shards.shard_for(client_id))
+        if result['enrolled']:
+            profile_cache.invalidate(client_id)
+        return result
+
+    def enroll_clients(self, program_id, client_ids):
+        result = write_batcher.run(
+            enroll_clients, program_id, client_ids, shard=shards.single_shard(client_ids)
+        )
+        profile_cache.invalidate_many(result['enrolled'])
+        return result
+
+    def enrolled_program_names(self, client_id):
+        return enrolled_program_names(client_id)
+
+    def get_profiles(self, client_ids):
+        return get_profiles(client_ids)
+
+    def wait_for_changes(self, positions, limit, timeout):
+        return wait_for_changes(positions, limit, timeout)
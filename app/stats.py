@@ -0,0 +1,118 @@
+from collections import Counter
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Client, ProgramStat, enrollment
+from sharding import shards
+from utils import decrypt_data
+
+def birth_bucket(date_of_birth):
+    """First year of the decade of a YYYY-MM-DD date, or 0 if it has no year."""
+    try:
+        return int(date_of_birth[:4]) // 10 * 10
+    except (TypeError, ValueError):
+        return 0
+
+def _upsert(rows):
+    dialect = sqlite if db.session.get_bind().dialect.name == 'sqlite' else postgresql
+    statement = dialect.insert(ProgramStat.__table__)
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=['program_id', 'gender', 'birth_bucket'],
+            set_={'count': ProgramStat.__table__.c.count + statement.excluded['count']}
+        ),
+        rows
+    )
+
+def count_enrollments(pairs, attributes):
+    """
+    Add newly inserted (client_id, program_id) pairs to the counters, in
+    the caller's transaction. attributes maps each client id to its
+    (gender, birth_bucket), as read by the caller.
+    """
+    counts = Counter()
+    for client_id, program_id in pairs:
+        gender, bucket = attributes[client_id]
+        counts[(program_id, gender, bucket or 0)] += 1
+    if counts:
+        _upsert([
+            {'program_id': program_id, 'gender': gender, 'birth_bucket': bucket, 'count': count}
+            for (program_id, gender, bucket), count in counts.items()
+        ])
+
+def summarize(rows):
+    summary = {'total': 0, 'by_gender': {}, 'by_birth_decade': {}, 'breakdown': []}
+    for gender, bucket, count in rows:
+        decade = str(bucket) if bucket else 'unknown'
+        summary['total'] += count
+        summary['by_gender'][gender] = summary['by_gender'].get(gender, 0) + count
+        summary['by_birth_decade'][decade] = summary['by_birth_decade'].get(decade, 0) + count
+        summary['breakdown'].append({'gender': gender, 'birth_decade': decade, 'count': count})
+    return summary
+
+def _merged_counts(*where):
+    """
+    Counters from every shard, summed per (program_id, gender, birth_bucket)
+    and sorted by them. Each shard counts the enrollments of its own clients.
+    """
+    counts = Counter()
+    for shard in range(shards.count):
+        with shards.on_shard(shard):
+            counts.update({
+                (row.program_id, row.gender, row.birth_bucket): row.count for row in db.session.execute(
+                    select(ProgramStat.program_id, ProgramStat.gender, ProgramStat.birth_bucket, ProgramStat.count)
+                    .where(ProgramStat.count > 0, *where)
+                )
+            })
+    return sorted(counts.items())
+
+def program_stats(program_id):
+    """Counters for one program; reads a bounded number of rows whatever the enrollment size."""
+    rows = [(gender, bucket, count) for (_, gender, bucket), count in _merged_counts(ProgramStat.program_id == program_id)]
+    return dict(summarize(rows), program_id=program_id)
+
+def all_program_stats():
+    by_program = {}
+    for (program_id, gender, bucket), count in _merged_counts():
+        by_program.setdefault(program_id, []).append((gender, bucket, count))
+    return [dict(summarize(rows), program_id=program_id) for program_id, rows in by_program.items()]
+
+def rebuild_stats(chunk_size=1000, report=print):
+    """
+    Recompute every counter from the enrollment table of each shard.
+    Clients registered before birth buckets existed get theirs filled in by
+    decrypting date_of_birth first.
+    """
+    fill = (
+        update(Client.__table__)
+        .where(Client.__table__.c.id == bindparam('b_id'))
+        .values(birth_bucket=bindparam('b_bucket'))
+    )
+    filled = 0
+    for shard in range(shards.count):
+        with shards.on_shard(shard):
+            while True:
+                rows = db.session.execute(
+                    select(Client.id, Client.date_of_birth).where(Client.birth_bucket.is_(None)).limit(chunk_size)
+                ).all()
+                if not rows:
+                    break
+                db.session.execute(fill, [
+                    {'b_id': row.id, 'b_bucket': birth_bucket(decrypt_data(row.date_of_birth))} for row in rows
+                ])
+                db.session.commit()
+                filled += len(rows)
+                report(f'{filled} birth buckets filled')
+
+    # Each shard counts the enrollments it holds
+    bucket = func.coalesce(Client.birth_bucket, 0)
+    for shard in range(shards.count):
+        with shards.on_shard(shard):
+            db.session.execute(delete(ProgramStat.__table__))
+            rows = db.session.execute(
+                select(enrollment.c.program_id, Client.gender, bucket.label('birth_bucket'), func.count().label('count'))
+                .select_from(enrollment.join(Client.__table__, Client.id == enrollment.c.client_id))
+                .group_by(enrollment.c.program_id, Client.gender, bucket)
+            ).mappings().all()
+            if rows:
+                _upsert([dict(row) for row in rows])
+        db.session.commit()
@@ -0,0 +1,32 @@
+from sqlalchemy import event
+from models import db
+from memory_store import open_memory_store
+from sql_store import SQLStore
+
+def install_pragmas(engine, pragmas):
+    """Run PRAGMA name=value for each pragma on every new connection of engine."""
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def init_storage(app):
+    """Apply SQLITE_PRAGMAS to every new connection of the app's engines, shards included."""
+    for engine in db.engines.values():
+        install_pragmas(engine, app.config.get('SQLITE_PRAGMAS'))
+
+def create_store(app, cache):
+    """The storage behind the routes, per STORAGE_BACKEND: 'sql' or 'memory'."""
+    backend = app.config.get('STORAGE_BACKEND', 'sql')
+    if backend == 'sql':
+        return SQLStore(app, cache)
+    if backend == 'memory':
+        if app.config.get('SHARD_COUNT', 1) > 1:
+            raise ValueError('STORAGE_BACKEND memory cannot be sharded; set SHARD_COUNT = 1')
+        return open_memory_store(app)
+    raise ValueError(f'Unknown STORAGE_BACKEND: {backend}')
@@ -0,0 +1,108 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select, update
+from models import db, ApiToken
+
+def hash_token(token):
+    # Tokens are long random strings, so an unsalted digest is enough to
+    # look them up without storing them
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class TokenAuthenticator:
+    """
+    Verifies bearer tokens against the api_token table, which stores only
+    SHA-256 digests. A token is found through the unique index on its
+    digest, so no secret is ever compared in Python and lookup cost does
+    not grow with the number of tokens issued.
+
+    Verified principals are kept in a bounded LRU keyed by digest for ttl
+    seconds, which makes the hot path one hash and one dict lookup.
+    revoke() drops the entry in this process at once; other processes stop
+    accepting the token within ttl seconds. Unknown tokens are not cached,
+    so they cannot push valid ones out.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('AUTH_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('AUTH_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def verify(self, token):
+        """Principal owning token, or None if it is unknown or revoked."""
+        if not token:
+            return None
+        digest = hash_token(token)
+        return self.cached(digest) or self.load(digest)
+
+    def cached(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def load(self, digest):
+        """Look digest up in the database and cache the principal if it is valid."""
+        principal = db.session.execute(
+            select(ApiToken.principal).where(ApiToken.token_hash == digest, ApiToken.revoked_at.is_(None))
+        ).scalar()
+        if principal is not None:
+            with self._lock:
+                self._entries[digest] = (principal, time.monotonic() + self.ttl)
+                self._entries.move_to_end(digest)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def issue(self, principal, token=None):
+        """
+        Store a token for principal, generating one unless given.
+
+        Returns:
+            tuple: (token id, token); the token cannot be recovered later
+        """
+        token = token or secrets.token_urlsafe(32)
+        row = ApiToken(token_hash=hash_token(token), principal=principal)
+        db.session.add(row)
+        db.session.commit()
+        return row.id, token
+
+    def revoke(self, token_id):
+        """Revoke a token by id. Returns False if it does not exist or is already revoked."""
+        digest = db.session.execute(
+            select(ApiToken.token_hash).where(ApiToken.id == token_id, ApiToken.revoked_at.is_(None))
+        ).scalar()
+        if digest is None:
+            return False
+        db.session.execute(
+            update(ApiToken.__table__).where(ApiToken.id == token_id).values(revoked_at=datetime.utcnow())
+        )
+        db.session.commit()
+        with self._lock:
+            self._entries.pop(digest, None)
+        return True
+
+api_tokens = TokenAuthenticator()
@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+from datetime import datetime
+from operator import itemgetter
+from sqlalchemy import func, select
+from models import db, Client, Program, enrollment
+from changes import enrollment_id, record_changes
+from clients import create_clients
+from enrollments import insert_ignore
+from sharding import shards
+from stats import rebuild_stats
+from utils import decrypt_data
+from validation import CLIENT_VALIDATOR, validate_many
+
+FIELDS = {
+    'programs': ['id', 'name', 'description', 'created_at'],
+    'clients': ['id', 'name', 'date_of_birth', 'gender', 'created_at'],
+    'enrollments': ['client_id', 'program_id']
+}
+# Programs and clients must exist before enrollments reference them
+ENTITIES = ('programs', 'clients', 'enrollments')
+
+def _path(directory, entity, fmt):
+    return os.path.join(directory, f'{entity}.{fmt}')
+
+def _write_records(path, fmt, fields, batches):
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields) if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+        for batch in batches:
+            if writer:
+                writer.writerows(batch)
+            else:
+                f.writelines(json.dumps(record) + '\n' for record in batch)
+            count += len(batch)
+    return count
+
+def _read_batches(path, fmt, batch_size):
+    with open(path, newline='') as f:
+        records = csv.DictReader(f) if fmt == 'csv' else (json.loads(line) for line in f if line.strip())
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def _stream(query, batch_size):
+    # yield_per streams from a server-side cursor instead of buffering the table
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        yield [row._asdict() for row in rows]
+
+def _stream_shards(entity, batch_size):
+    if entity == 'programs':
+        # Shards only hold copies of the primary's programs
+        yield from _stream(select(Program.id, Program.name, Program.description, Program.created_at), batch_size)
+        return
+    if entity == 'clients':
+        query = select(Client.id, Client.name, Client.date_of_birth, Client.gender, Client.created_at)
+    else:
+        query = select(enrollment.c.client_id, enrollment.c.program_id)
+    for shard in range(shards.count):
+        with shards.on_shard(shard):
+            yield from _stream(query, batch_size)
+
+def _export_batches(entity, encrypted, batch_size):
+    for batch in _stream_shards(entity, batch_size):
+        for record in batch:
+            if 'created_at' in record:
+                record['created_at'] = record['created_at'].isoformat()
+            if entity == 'clients' and not encrypted:
+                record['name'] = decrypt_data(record['name'])
+                record['date_of_birth'] = decrypt_data(record['date_of_birth'])
+        yield batch
+
+def export_data(directory, fmt='ndjson', encrypted=False, batch_size=5000):
+    """
+    Write programs, clients and enrollments to directory in constant memory,
+    plus a manifest.json with row counts for import to verify.
+
+    Returns:
+        dict: Rows written per entity
+    """
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    for entity in ENTITIES:
+        counts[entity] = _write_records(
+            _path(directory, entity, fmt), fmt, FIELDS[entity],
+            _export_batches(entity, encrypted, batch_size)
+        )
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump({'format': fmt, 'encrypted': encrypted, 'counts': counts}, f, indent=2)
+    return counts
+
+def _import_batch(entity, batch, encrypted):
+    for record in batch:
+        if record.get('created_at'):
+            record['created_at'] = datetime.fromisoformat(record['created_at'])
+    if entity == 'programs':
+        db.session.execute(Program.__table__.insert(), batch)
+        record_changes('program', 'create', [record['id'] for record in batch])
+        return len(batch)
+    if entity == 'clients':
+        if not encrypted:
+            errors = validate_many(CLIENT_VALIDATOR, batch)
+            if errors:
+                index, message = errors[0]
+                raise ValueError(f'clients: invalid record {batch[index].get("id")}: {message}')
+        return len(create_clients(batch, encrypted=encrypted, imported=True))
+    inserted = 0
+    for shard, records in shards.group(batch, itemgetter('client_id')).items():
+        with shards.on_shard(shard):
+            pairs = db.session.execute(insert_ignore(), records).all()
+            # Pairs already present are skipped, and so get no change entry
+            record_changes('enrollment', 'create', [
+                enrollment_id(client_id, program_id) for client_id, program_id in pairs
+            ])
+        inserted += len(pairs)
+    return inserted
+
+def _table_count(entity):
+    if entity == 'programs':
+        return db.session.execute(select(func.count()).select_from(Program.__table__)).scalar()
+    table = Client.__table__ if entity == 'clients' else enrollment
+    count = 0
+    for shard in range(shards.count):
+        with shards.on_shard(shard):
+            count += db.session.execute(select(func.count()).select_from(table)).scalar()
+    return count
+
+def import_data(directory, batch_size=10000, report=print):
+    """
+    Load an export_data() directory with core executemany inserts,
+    committing every batch_size rows, then check row counts against the
+    manifest.
+
+    Returns:
+        dict: Rows inserted per entity
+
+    Raises:
+        ValueError: If the counts read or inserted differ from the manifest
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    fmt, encrypted = manifest['format'], manifest['encrypted']
+    counts = {}
+    for entity in ENTITIES:
+        before = _table_count(entity)
+        read = inserted = 0
+        for batch in _read_batches(_path(directory, entity, fmt), fmt, batch_size):
+            read += len(batch)
+            inserted += _import_batch(entity, batch, encrypted)
+            db.session.commit()
+            if entity == 'programs':
+                shards.replicate(Program.__table__, batch)
+            report(f'{entity}: {read} rows')
+        counts[entity] = inserted
+        expected = manifest['counts'][entity]
+        if read != expected or _table_count(entity) - before != expected:
+            raise ValueError(
+                f'{entity}: manifest lists {expected} rows, read {read}, '
+                f'table grew by {_table_count(entity) - before}'
+            )
+    # Enrollments were bulk inserted past the incremental counters
+    rebuild_stats(report=report)
+    return counts
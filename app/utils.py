@@ -1,11 +1,85 @@
-from cryptography.fernet import Fernet
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+from cryptography.fernet import Fernet, MultiFernet
+from metrics import metrics
 
-# Generate and store encryption key (in production, use secure storage)
-key = Fernet.generate_key()
-cipher = Fernet(key)
+DEFAULT_KEYFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'his_keys.json')
+
+def load_keys():
+    """
+    Load key material once per process.
+
+    Keys come from HIS_FERNET_KEYS (comma separated, newest first) and
+    HIS_INDEX_KEY, or else from the JSON keyfile at HIS_KEYFILE. If neither
+    is set and the keyfile does not exist, it is created with fresh keys.
+
+    Returns:
+        tuple: (list of Fernet keys, newest first; blind index key bytes)
+    """
+    env_keys = os.environ.get('HIS_FERNET_KEYS')
+    if env_keys:
+        index_key = os.environ.get('HIS_INDEX_KEY')
+        if not index_key:
+            raise RuntimeError('HIS_INDEX_KEY must be set together with HIS_FERNET_KEYS')
+        return [k.strip() for k in env_keys.split(',') if k.strip()], base64.urlsafe_b64decode(index_key)
+
+    path = os.environ.get('HIS_KEYFILE', DEFAULT_KEYFILE)
+    if not os.path.exists(path):
+        create_keyfile(path)
+    with open(path) as f:
+        keys = json.load(f)
+    return keys['fernet'], base64.urlsafe_b64decode(keys['index'])
+
+def create_keyfile(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    keys = {
+        'fernet': [Fernet.generate_key().decode()],
+        'index': base64.urlsafe_b64encode(os.urandom(32)).decode()
+    }
+    # Written in full to a private temp file, then linked into place. A link
+    # never replaces an existing file, so if several processes start at
+    # once only the first one's keys are used, and nobody reads a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.his_keys-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(keys, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+fernet_keys, index_key = load_keys()
+# Encrypts with the newest key and decrypts with any of them, so keys can rotate
+cipher = MultiFernet([Fernet(k) for k in fernet_keys])
+# Keyed once; blind_index() copies it instead of re-deriving the HMAC pads per term
+index_mac = hmac.new(index_key, digestmod=hashlib.sha256)
 
 def encrypt_data(data):
-    return cipher.encrypt(data.encode()).decode()
+    with metrics.crypto_timer():
+        return cipher.encrypt(data.encode()).decode()
+
+def encrypt_many(values):
+    encrypt = cipher.encrypt
+    with metrics.crypto_timer():
+        return [encrypt(value.encode()).decode() for value in values]
 
 def decrypt_data(data):
-    return cipher.decrypt(data.encode()).decode()
\ No newline at end of file
+    with metrics.crypto_timer():
+        return cipher.decrypt(data.encode()).decode()
+
+# Name words and prefixes repeat across clients, so most terms of a bulk
+# registration were already hashed
+@functools.lru_cache(maxsize=65536)
+def blind_index(term):
+    mac = index_mac.copy()
+    mac.update(term.encode())
+    return mac.hexdigest()[:32]
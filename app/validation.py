@@ -0,0 +1,47 @@
+from functools import wraps
+from flask import jsonify, request
+from jsonschema import Draft7Validator, FormatChecker
+from schemas import (
+    PROGRAM_SCHEMA, CLIENT_SCHEMA, ENROLL_SCHEMA, PROGRAM_ENROLL_SCHEMA, PROFILES_SCHEMA
+)
+
+def compile_schema(schema):
+    """Check schema once and build a reusable validator with format checking on."""
+    Draft7Validator.check_schema(schema)
+    return Draft7Validator(schema, format_checker=FormatChecker())
+
+PROGRAM_VALIDATOR = compile_schema(PROGRAM_SCHEMA)
+CLIENT_VALIDATOR = compile_schema(CLIENT_SCHEMA)
+ENROLL_VALIDATOR = compile_schema(ENROLL_SCHEMA)
+PROGRAM_ENROLL_VALIDATOR = compile_schema(PROGRAM_ENROLL_SCHEMA)
+PROFILES_VALIDATOR = compile_schema(PROFILES_SCHEMA)
+
+def first_error(validator, instance):
+    """Message of the first validation error, or None if instance is valid."""
+    error = next(validator.iter_errors(instance), None)
+    return None if error is None else error.message
+
+def validate_many(validator, records):
+    """Validate records in one call; returns a list of (index, message) for invalid ones."""
+    errors = []
+    for index, record in enumerate(records):
+        message = first_error(validator, record)
+        if message is not None:
+            errors.append((index, message))
+    return errors
+
+def validate_json(validator):
+    """
+    Validate the JSON body against validator, answering 400 on failure.
+    The parsed body is passed to the view as its first argument.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(silent=True)
+            error = first_error(validator, data)
+            if error is not None:
+                return jsonify({'error': error}), 400
+            return view(data, *args, **kwargs)
+        return wrapper
+    return decorator
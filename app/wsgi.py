@@ -0,0 +1,7 @@
+"""
+WSGI entry point for production servers. Imported once in the gunicorn
+master (see gunicorn.conf.py) so workers share the app by copy-on-write.
+"""
+from app import create_app
+
+app = create_app()
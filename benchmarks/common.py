@@ -0,0 +1,102 @@
+import os
+import random
+import resource
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+# Keys for the throwaway databases, instead of creating app/instance/his_keys.json.
+# Set before the app is imported, as utils loads keys on import.
+KEY_DIR = tempfile.TemporaryDirectory(prefix='his-bench-keys-')
+os.environ.setdefault('HIS_KEYFILE', os.path.join(KEY_DIR.name, 'his_keys.json'))
+
+from app import create_app
+from config import Config
+from tokens import api_tokens
+
+TOKEN = 'bench-token'
+HEADERS = {'Authorization': f'Bearer {TOKEN}'}
+
+FIRST_NAMES = ['John', 'Mary', 'Achieng', 'Otieno', 'Wanjiku', 'Kamau', 'Amina', 'Hassan',
+               'Grace', 'Peter', 'Njeri', 'Mwangi', 'Fatuma', 'Ali', 'Rose', 'David']
+LAST_NAMES = ['Doe', 'Odhiambo', 'Mutua', 'Kariuki', 'Omondi', 'Wambui', 'Kiptoo', 'Chebet',
+              'Mohamed', 'Njoroge', 'Atieno', 'Kimani', 'Owino', 'Barasa', 'Korir', 'Nyambura']
+GENDERS = ['Male', 'Female', 'Other']
+
+def make_app(workdir=None, base=Config, **overrides):
+    """create_app() with config base against a throwaway SQLite database in workdir."""
+    workdir = workdir or tempfile.mkdtemp(prefix='his-bench-')
+
+    class BenchConfig(base):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        PROFILE_CACHE_PATH = os.path.join(workdir, 'profile_cache.db')
+
+    for name, value in overrides.items():
+        setattr(BenchConfig, name, value)
+    app = create_app(BenchConfig)
+    with app.app_context():
+        if api_tokens.verify(TOKEN) is None:
+            api_tokens.issue('bench', TOKEN)
+    return app, workdir
+
+def random_client(rng):
+    return {
+        'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        'date_of_birth': f'{rng.randint(1940, 2020)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'gender': rng.choice(GENDERS)
+    }
+
+def seed(app, clients=10000, programs=50, density=2.0, seed=0, chunk=5000):
+    """
+    Insert a synthetic dataset. density is the mean number of programs
+    each client is enrolled in.
+
+    Returns:
+        tuple: (client_ids, program_ids)
+    """
+    rng = random.Random(seed)
+    # Through the app's store, so every STORAGE_BACKEND can be seeded
+    store = app.extensions['his_store']
+    with app.app_context():
+        program_ids = [store.create_program(f'Program {i}', f'Synthetic program {i}')['id']
+                       for i in range(programs)]
+
+        client_ids = []
+        for start in range(0, clients, chunk):
+            records = [random_client(rng) for _ in range(min(chunk, clients - start))]
+            client_ids.extend(store.register_clients(records))
+
+        members = {program_id: [] for program_id in program_ids}
+        per_client = min(density, programs)
+        for client_id in client_ids:
+            count = int(per_client) + (rng.random() < per_client % 1)
+            for program_id in rng.sample(program_ids, count):
+                members[program_id].append(client_id)
+        for program_id, ids in members.items():
+            if ids:
+                store.enroll_clients(program_id, ids)
+    return client_ids, program_ids
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies, elapsed, errors=0):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed if elapsed else None,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
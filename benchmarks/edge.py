@@ -0,0 +1,137 @@
+"""
+Memory and snapshot cost of the in-memory store used on edge boxes
+(STORAGE_BACKEND = 'memory'). Reports resident memory per client after
+registering and enrolling, snapshot size and time, and restore time and
+memory in a fresh process.
+
+    python benchmarks/edge.py --clients 1000000 --density 2 --out edge.json
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import FIRST_NAMES, LAST_NAMES, random_client
+from memory_store import MemoryStore
+
+SYLLABLES = ['ka', 'mo', 'ni', 'ro', 'we', 'tu', 'sha', 'ki', 'ba', 'le', 'do', 'ya', 'mu', 'ge', 'na', 'pi',
+             'ha', 'zu', 'ti', 'fo', 'ri', 'sa', 'ko', 'me', 'ju', 'li', 'ne', 'bo', 'chi', 'wa']
+
+def current_rss_mb():
+    """Resident set size now, unlike common.peak_rss_mb(); Linux only."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+def peak_since_reset_mb():
+    """Peak resident set size since the last reset_peak(); Linux only."""
+    with open('/proc/self/status') as f:
+        kib = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    return kib / 1024
+
+def reset_peak():
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+def random_name(rng):
+    # A generated middle name gives a realistic number of distinct search terms
+    middle = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+    return f'{rng.choice(FIRST_NAMES)} {middle} {rng.choice(LAST_NAMES)}'
+
+def build(clients, programs, density, seed, chunk=5000):
+    rng = random.Random(seed)
+    store = MemoryStore()
+    program_ids = [store.create_program(f'Program {i}', f'Synthetic program {i}')['id'] for i in range(programs)]
+    client_ids = []
+    for start in range(0, clients, chunk):
+        records = [dict(random_client(rng), name=random_name(rng)) for _ in range(min(chunk, clients - start))]
+        client_ids.extend(store.register_clients(records))
+    members = {program_id: [] for program_id in program_ids}
+    per_client = min(density, programs)
+    for client_id in client_ids:
+        count = int(per_client) + (rng.random() < per_client % 1)
+        for program_id in rng.sample(program_ids, count):
+            members[program_id].append(client_id)
+    for program_id, ids in members.items():
+        for start in range(0, len(ids), chunk):
+            store.enroll_clients(program_id, ids[start:start + chunk])
+    return store, client_ids
+
+def restore(path):
+    gc.collect()
+    before = current_rss_mb()
+    start = time.perf_counter()
+    store = MemoryStore.restore(path)
+    seconds = time.perf_counter() - start
+    gc.collect()
+    return {
+        'restore_seconds': seconds,
+        'restored_rss_mb': current_rss_mb() - before,
+        # Whole process, including the decrypted sections
+        'restore_peak_rss_mb': peak_since_reset_mb(),
+        'clients': store.client_count
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200000)
+    parser.add_argument('--programs', type=int, default=50)
+    parser.add_argument('--density', type=float, default=2.0, help='mean programs per client')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--restore', help=argparse.SUPPRESS)
+    parser.add_argument('--out')
+    args = parser.parse_args(argv)
+
+    if args.restore:
+        print(json.dumps(restore(args.restore)))
+        return
+
+    gc.collect()
+    before = current_rss_mb()
+    start = time.perf_counter()
+    store, client_ids = build(args.clients, args.programs, args.density, args.seed)
+    build_seconds = time.perf_counter() - start
+    # Ids kept for the benchmark are not part of the store
+    del client_ids
+    gc.collect()
+    store_mb = current_rss_mb() - before
+
+    with tempfile.TemporaryDirectory(prefix='his-edge-') as workdir:
+        path = os.path.join(workdir, 'store.bin')
+        reset_peak()
+        start = time.perf_counter()
+        store.snapshot(path)
+        snapshot_seconds = time.perf_counter() - start
+        snapshot_peak_mb = peak_since_reset_mb()
+        snapshot_mb = os.path.getsize(path) / (1024 * 1024)
+        restored = json.loads(subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--restore', path],
+            check=True, capture_output=True, text=True
+        ).stdout)
+
+    results = {
+        'clients': args.clients,
+        'enrollments': len(store.edge_program),
+        'build_seconds': build_seconds,
+        'store_rss_mb': store_mb,
+        'bytes_per_client': store_mb * 1024 * 1024 / args.clients,
+        'snapshot_seconds': snapshot_seconds,
+        'snapshot_mb': snapshot_mb,
+        # Whole process, including the copies made while snapshotting
+        'snapshot_peak_rss_mb': snapshot_peak_mb,
+        **restored
+    }
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == '__main__':
+    main()
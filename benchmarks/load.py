@@ -0,0 +1,184 @@
+"""
+Load test every API route against a seeded temporary database.
+
+    python benchmarks/load.py --clients 20000 --concurrency 1 8 32 --out results.json
+    python benchmarks/load.py --compare results.json
+    python benchmarks/load.py --scenarios bulk --bulk-size 20000 --requests 5 --concurrency 1
+    python benchmarks/load.py --scenarios bulk-enroll --clients 50000 --density 0 --bulk-size 50000 --requests 5 --concurrency 1
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import FIRST_NAMES, HEADERS, make_app, peak_rss_mb, random_client, seed, summarize
+from config import CONFIGS
+
+class TestClientDriver:
+    name = 'test_client'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=HEADERS)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+class WSGIServerDriver:
+    name = 'wsgi_server'
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, method, path, body=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = dict(HEADERS)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+
+def scenarios(client_ids, program_ids, bulk_size):
+    return {
+        'register': lambda rng: ('POST', '/clients', random_client(rng)),
+        'enroll': lambda rng: ('POST', f'/clients/{rng.choice(client_ids)}/enroll',
+                               {'program_id': rng.choice(program_ids)}),
+        'search': lambda rng: ('GET', f'/clients/search?name={rng.choice(FIRST_NAMES)[:3]}', None),
+        'profile': lambda rng: ('GET', f'/clients/{rng.choice(client_ids)}', None),
+        'bulk': lambda rng: ('POST', '/clients/bulk', [random_client(rng) for _ in range(bulk_size)]),
+        'bulk-enroll': lambda rng: ('POST', f'/programs/{rng.choice(program_ids)}/enroll',
+                                    {'client_ids': rng.sample(client_ids, min(bulk_size, len(client_ids)))})
+    }
+
+def run(driver, make_request, concurrency, requests, seed):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_worker = max(1, requests // concurrency)
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        failed = 0
+        for _ in range(per_worker):
+            method, path, body = make_request(rng)
+            start = time.perf_counter()
+            status = driver.request(method, path, body)
+            local.append(time.perf_counter() - start)
+            if status >= 400:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - start, errors[0])
+
+def compare(baseline, current, tolerance):
+    """Print per-case deltas; returns the number of regressions beyond tolerance."""
+    regressions = 0
+    for key, result in sorted(current['results'].items()):
+        base = baseline['results'].get(key)
+        if not base or not base['p95_ms'] or not result['p95_ms']:
+            continue
+        p95 = (result['p95_ms'] - base['p95_ms']) / base['p95_ms']
+        rps = (result['throughput_rps'] - base['throughput_rps']) / base['throughput_rps']
+        regressed = p95 > tolerance or rps < -tolerance
+        regressions += regressed
+        print(f'{key:40} p95 {p95:+7.1%}  throughput {rps:+7.1%}{"  REGRESSION" if regressed else ""}')
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--programs', type=int, default=50)
+    parser.add_argument('--density', type=float, default=2.0, help='mean enrollments per client')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario and concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--scenarios', nargs='+', default=['register', 'enroll', 'search', 'profile'],
+                        help="also 'bulk' and 'bulk-enroll', left out by default as each request "
+                             "registers or enrolls --bulk-size clients")
+    parser.add_argument('--bulk-size', type=int, default=1000,
+                        help='clients per POST /clients/bulk or /programs/<id>/enroll request')
+    parser.add_argument('--drivers', nargs='+', default=['test_client', 'wsgi_server'])
+    parser.add_argument('--config', default=os.environ.get('HIS_CONFIG', 'default'))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    app, workdir = make_app(base=CONFIGS[args.config])
+    start = time.perf_counter()
+    client_ids, program_ids = seed(app, args.clients, args.programs, args.density, args.seed)
+    seed_seconds = time.perf_counter() - start
+
+    cases = scenarios(client_ids, program_ids, args.bulk_size)
+    drivers = {'test_client': TestClientDriver, 'wsgi_server': WSGIServerDriver}
+    results = {}
+    for driver_name in args.drivers:
+        driver = drivers[driver_name](app)
+        try:
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    key = f'{driver_name}/{scenario}/c{concurrency}'
+                    results[key] = run(driver, cases[scenario], concurrency, args.requests, args.seed)
+                    if scenario in ('bulk', 'bulk-enroll') and results[key]['throughput_rps']:
+                        results[key]['clients_per_s'] = results[key]['throughput_rps'] * args.bulk_size
+                    print(f'{key:40} {json.dumps(results[key])}', file=sys.stderr)
+        finally:
+            driver.close()
+
+    report = {
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('out', 'compare')},
+        'seed_seconds': seed_seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'database': workdir,
+        'results': results
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Micro-benchmarks for field encryption, decryption and request validation.
+
+    python benchmarks/micro.py --number 20000 --out micro.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from jsonschema import validate
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import random_client
+from schemas import CLIENT_SCHEMA
+from decryption import DecryptionService
+from utils import decrypt_data, encrypt_data, encrypt_many
+from validation import CLIENT_VALIDATOR, first_error, validate_many
+
+def bench(function, number, repeat):
+    """Best-of-repeat time per call in microseconds."""
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--out')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    record = random_client(rng)
+    records = [random_client(rng) for _ in range(args.batch)]
+    names = [r['name'] for r in records]
+    ciphertext = encrypt_data(record['name'])
+    ciphertexts = encrypt_many(names)
+    uncached = DecryptionService(max_entries=0)
+    cached = DecryptionService()
+    cached.decrypt_many(ciphertexts)
+
+    batch_number = max(1, args.number // args.batch)
+    results = {
+        'encrypt_data_us': bench(lambda: encrypt_data(record['name']), args.number, args.repeat),
+        'decrypt_data_us': bench(lambda: decrypt_data(ciphertext), args.number, args.repeat),
+        'encrypt_many_per_value_us': bench(lambda: encrypt_many(names), batch_number, args.repeat) / args.batch,
+        'decrypt_many_uncached_per_value_us':
+            bench(lambda: uncached.decrypt_many(ciphertexts), batch_number, args.repeat) / args.batch,
+        'decrypt_many_cached_per_value_us':
+            bench(lambda: cached.decrypt_many(ciphertexts), batch_number, args.repeat) / args.batch,
+        'jsonschema_validate_client_us':
+            bench(lambda: validate(instance=record, schema=CLIENT_SCHEMA), args.number, args.repeat),
+        'validate_client_us': bench(lambda: first_error(CLIENT_VALIDATOR, record), args.number, args.repeat),
+        'validate_many_per_record_us':
+            bench(lambda: validate_many(CLIENT_VALIDATOR, records), batch_number, args.repeat) / args.batch
+    }
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    print(output)
+
+if __name__ == '__main__':
+    main()
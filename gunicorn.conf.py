@@ -0,0 +1,34 @@
+"""
+Multi-worker production serving:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is built once in the master (preload_app) and workers are forked
+from it. Key material is read from HIS_FERNET_KEYS/HIS_INDEX_KEY or
+HIS_KEYFILE, so every worker shares the same keys.
+"""
+import gc
+import multiprocessing
+import os
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app')
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('HIS_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('HIS_WORKERS', multiprocessing.cpu_count()))
+# More than one thread selects gunicorn's gthread worker
+threads = int(os.environ.get('HIS_THREADS', 4))
+preload_app = True
+
+def when_ready(server):
+    # Objects built by the preloaded app are never collected; freezing them
+    # keeps workers' GC from writing to, and so copying, the shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # SQLite connections must not cross a fork; drop the master's pools,
+    # including those of the shards it created and filled at startup
+    from models import db
+    from wsgi import app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+# Keys for the throwaway databases, instead of creating app/instance/his_keys.json.
+# Set before the app is imported, as utils loads keys on import.
+KEY_DIR = tempfile.TemporaryDirectory(prefix='his-test-keys-')
+os.environ.setdefault('HIS_KEYFILE', os.path.join(KEY_DIR.name, 'his_keys.json'))
+
+from app import create_app
+from config import Config
+from tokens import api_tokens
+
+TOKEN = 'test-token'
+HEADERS = {'Authorization': f'Bearer {TOKEN}'}
+
+def make_test_app(testcase, base=Config, **overrides):
+    """
+    create_app() against throwaway databases in a temporary directory that
+    is removed when testcase finishes. overrides are set on the config.
+    """
+    workdir = tempfile.TemporaryDirectory()
+
+    class TestConfig(base):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir.name, 'test.db')
+        SHARD_DATABASE_URI = 'sqlite:///' + os.path.join(workdir.name, 'test.shard{shard}.db')
+        PROFILE_CACHE_PATH = os.path.join(workdir.name, 'profile_cache.db')
+
+    for name, value in overrides.items():
+        setattr(TestConfig, name, value)
+    app = create_app(TestConfig)
+    with app.app_context():
+        api_tokens.issue('test', TOKEN)
+
+    def cleanup():
+        with app.app_context():
+            for engine in app.extensions['sqlalchemy'].engines.values():
+                engine.dispose()
+        workdir.cleanup()
+
+    testcase.addCleanup(cleanup)
+    app.workdir = workdir.name
+    return app
@@ -0,0 +1,31 @@
+import unittest
+
+from support import HEADERS, make_test_app
+
+CLIENT = {'name': 'Jane Doe', 'date_of_birth': '1990-01-01', 'gender': 'Female'}
+
+class ClientRegistrationTest(unittest.TestCase):
+    def setUp(self):
+        self.client = make_test_app(self).test_client()
+
+    def test_register_ignores_id_and_created_at(self):
+        first = self.client.post('/clients', json=dict(CLIENT, id='chosen', created_at='yesterday'),
+                                 headers=HEADERS)
+        self.assertEqual(first.status_code, 201)
+        self.assertNotEqual(first.get_json()['id'], 'chosen')
+
+        # The same body again is a new client, not a duplicate key
+        second = self.client.post('/clients', json=dict(CLIENT, id='chosen'), headers=HEADERS)
+        self.assertEqual(second.status_code, 201)
+        self.assertNotEqual(second.get_json()['id'], first.get_json()['id'])
+
+    def test_bulk_register_ignores_id_and_created_at(self):
+        records = [dict(CLIENT, id='chosen', created_at='yesterday') for _ in range(3)]
+        response = self.client.post('/clients/bulk', json=records, headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        ids = [result.get('id') for result in response.get_json()['results']]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertNotIn('chosen', ids)
+
+if __name__ == '__main__':
+    unittest.main()
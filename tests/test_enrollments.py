@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+from sqlalchemy import func, select
+
+from support import HEADERS, make_test_app
+from config import SQLiteProductionConfig
+from models import db, enrollment
+
+CLIENTS = 20
+
+class ConcurrentEnrollmentTest(unittest.TestCase):
+    def setUp(self):
+        self.app = self.make_app()
+        client = self.app.test_client()
+        self.program_id = client.post('/programs', json={'name': 'HIV', 'description': 'HIV care'},
+                                      headers=HEADERS).get_json()['id']
+        records = [{'name': f'Client {i}', 'date_of_birth': '1985-05-05', 'gender': 'Female'} for i in range(CLIENTS)]
+        results = client.post('/clients/bulk', json=records, headers=HEADERS).get_json()['results']
+        self.client_ids = [result['id'] for result in results]
+
+    def make_app(self):
+        return make_test_app(self, SQLiteProductionConfig)
+
+    def test_duplicate_enrollments_are_counted_once(self):
+        responses = []
+        lock = threading.Lock()
+
+        def worker(path, body):
+            response = self.app.test_client().post(path, json=body, headers=HEADERS)
+            with lock:
+                responses.append((response.status_code, response.get_json()['enrolled']))
+
+        # The same pairs from both enrollment routes at once
+        jobs = [(f'/programs/{self.program_id}/enroll', {'client_ids': self.client_ids})] * 8 + [
+            (f'/clients/{client_id}/enroll', {'program_ids': [self.program_id]}) for client_id in self.client_ids
+        ]
+        threads = [threading.Thread(target=worker, args=job) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with self.app.app_context():
+            rows = db.session.execute(select(func.count()).select_from(enrollment)).scalar()
+        client = self.app.test_client()
+        stats = client.get(f'/programs/{self.program_id}/stats', headers=HEADERS).get_json()
+        changes = client.get('/changes', query_string={'limit': 1000}, headers=HEADERS).get_json()['changes']
+        self.assertEqual(rows, CLIENTS)
+        self.assertEqual({status for status, _ in responses}, {200})
+        # The program route returns a count, the client route program ids
+        self.assertEqual(sum(n if isinstance(n, int) else len(n) for _, n in responses), CLIENTS)
+        self.assertEqual(stats['total'], rows)
+        self.assertEqual(sum(1 for change in changes if change['entity'] == 'enrollment'), rows)
+
+class BatchedConcurrentEnrollmentTest(ConcurrentEnrollmentTest):
+    """The same enrollments through group commit."""
+
+    def make_app(self):
+        return make_test_app(self, SQLiteProductionConfig, WRITE_BATCH_SIZE=16)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import uuid
+from unittest import mock
+
+from sqlalchemy import select, text
+
+from support import HEADERS, make_test_app
+from models import db, Client
+from profile_cache import profile_cache
+
+CLIENTS = [
+    {'name': 'Achieng Otieno', 'date_of_birth': '1985-03-02', 'gender': 'Female'},
+    {'name': 'Otieno Kamau', 'date_of_birth': '1990-07-15', 'gender': 'Male'}
+]
+
+class MigrateIdsTest(unittest.TestCase):
+    def setUp(self):
+        self.app = make_test_app(self)
+        self.client = self.app.test_client()
+
+    def post(self, path, body):
+        response = self.client.post(path, json=body, headers=HEADERS)
+        self.assertLess(response.status_code, 300, response.get_json())
+        return response.get_json()
+
+    def read_all(self, client_ids, program_id):
+        paths = [
+            ('/clients', {}), ('/clients/search', {'name': 'otieno'}), ('/programs', {}),
+            (f'/programs/{program_id}/stats', {})
+        ] + [(f'/clients/{client_id}', {}) for client_id in client_ids]
+        responses = []
+        for path, args in paths:
+            response = self.client.get(path, query_string=args, headers=HEADERS)
+            self.assertEqual(response.status_code, 200, path)
+            responses.append(response.get_json())
+        return responses
+
+    def stored_types(self):
+        with self.app.app_context():
+            return {
+                table: set(db.session.execute(text(f'SELECT DISTINCT typeof({column}) FROM {table}')).scalars())
+                for table, column in (('client', 'id'), ('program', 'id'), ('enrollment', 'client_id'),
+                                      ('enrollment', 'program_id'))
+            }
+
+    def migrate(self, target):
+        result = self.app.test_cli_runner().invoke(args=['his', 'migrate-ids', '--to', target])
+        self.assertEqual(result.exit_code, 0, result.output)
+        # So profiles are read back from the converted rows
+        profile_cache.clear()
+
+    def test_migrate_ids_to_binary_and_back(self):
+        program_id = self.post('/programs', {'name': 'Malaria', 'description': 'Malaria treatment'})['id']
+        client_ids = [self.post('/clients', record)['id'] for record in CLIENTS]
+        self.post(f'/programs/{program_id}/enroll', {'client_ids': client_ids})
+        before = self.read_all(client_ids, program_id)
+
+        self.migrate('binary')
+        self.assertEqual(set.union(*self.stored_types().values()), {'blob'})
+        with mock.patch('ids.BINARY_IDS', True):
+            self.assertEqual(self.read_all(client_ids, program_id), before)
+            # New ids are time-ordered and sit beside the converted ones
+            new_id = self.post('/clients', CLIENTS[0])['id']
+            self.assertEqual(uuid.UUID(new_id).version, 7)
+            self.assertEqual(self.post(f'/programs/{program_id}/enroll', {'client_ids': [new_id]})['enrolled'], 1)
+            with self.app.app_context():
+                self.assertEqual(db.session.execute(select(Client.id).where(Client.id == new_id)).scalar(), new_id)
+
+        self.migrate('text')
+        self.assertEqual(set.union(*self.stored_types().values()), {'text'})
+        after = self.read_all(client_ids + [new_id], program_id)
+        self.assertEqual(after[-3:-1], before[-2:])
+        self.assertEqual(after[3]['total'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
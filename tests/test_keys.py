@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from support import APP_DIR
+
+# Prints the keys a fresh process loads, creating the keyfile if needed
+LOAD_KEYS = 'import json, utils; print(json.dumps(utils.fernet_keys))'
+
+class KeyfileTest(unittest.TestCase):
+    def test_processes_starting_at_once_share_one_keyfile(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'instance', 'his_keys.json')
+            env = dict(os.environ, HIS_KEYFILE=path, PYTHONPATH=APP_DIR)
+            env.pop('HIS_FERNET_KEYS', None)
+            processes = [
+                subprocess.Popen([sys.executable, '-c', LOAD_KEYS], env=env, stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, text=True)
+                for _ in range(8)
+            ]
+            outputs = [process.communicate() for process in processes]
+            self.assertEqual([process.returncode for process in processes], [0] * 8, outputs)
+            self.assertEqual(len({stdout for stdout, _ in outputs}), 1)
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['his_keys.json'])
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+if __name__ == '__main__':
+    unittest.main()
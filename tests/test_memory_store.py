@@ -0,0 +1,136 @@
+import os
+import threading
+import unittest
+
+from support import HEADERS, make_test_app
+from config import MemoryConfig
+from memory_store import MemoryStore
+
+CLIENTS = [
+    {'name': 'Achieng Otieno', 'date_of_birth': '1985-03-02', 'gender': 'Female'},
+    {'name': 'Otieno Kamau', 'date_of_birth': '1990-07-15', 'gender': 'Male'},
+    {'name': 'Grace Wanjiku', 'date_of_birth': '2001-11-30', 'gender': 'Female'}
+]
+
+class StoreRoutesTest(unittest.TestCase):
+    """The API on the default SQL store; MemoryStoreRoutesTest runs it on the memory store."""
+
+    def make_app(self, **overrides):
+        return make_test_app(self, **overrides)
+
+    def setUp(self):
+        self.app = self.make_app()
+        self.client = self.app.test_client()
+
+    def post(self, path, body):
+        response = self.client.post(path, json=body, headers=HEADERS)
+        self.assertLess(response.status_code, 300, response.get_json())
+        return response.get_json()
+
+    def get(self, path, **args):
+        response = self.client.get(path, query_string=args, headers=HEADERS)
+        self.assertEqual(response.status_code, 200, response.get_json())
+        return response
+
+    def populate(self):
+        program = self.post('/programs', {'name': 'Malaria', 'description': 'Malaria treatment'})
+        other = self.post('/programs', {'name': 'TB', 'description': 'Tuberculosis care'})
+        first = self.post('/clients', CLIENTS[0])
+        rest = self.post('/clients/bulk', CLIENTS[1:])['results']
+        client_ids = [first['id']] + [result['id'] for result in rest]
+        self.post(f'/clients/{client_ids[0]}/enroll', {'program_ids': [program['id'], other['id']]})
+        self.post(f'/programs/{program["id"]}/enroll', {'client_ids': client_ids + ['missing']})
+        return program, other, client_ids
+
+    def test_routes(self):
+        program, other, client_ids = self.populate()
+
+        listing = [c['id'] for c in self.get('/clients').get_json()]
+        self.assertEqual(sorted(listing), sorted(client_ids))
+        first_page = self.get('/clients', limit=2)
+        self.assertIn('rel="next"', first_page.headers['Link'])
+        second_page = self.get('/clients', limit=2, cursor=first_page.headers['X-Next-Cursor']).get_json()
+        self.assertEqual([c['id'] for c in first_page.get_json() + second_page], listing)
+
+        found = self.get('/clients/search', name='otie').get_json()
+        self.assertEqual(sorted(c['name'] for c in found), ['Achieng Otieno', 'Otieno Kamau'])
+        streamed = self.get('/clients/search', name='gra', format='ndjson').data.splitlines()
+        self.assertEqual(len(streamed), 1)
+
+        profile = self.get(f'/clients/{client_ids[0]}')
+        self.assertEqual(profile.get_json()['date_of_birth'], '1985-03-02')
+        self.assertEqual({p['name'] for p in profile.get_json()['enrolled_programs']}, {'Malaria', 'TB'})
+        revalidated = self.client.get(f'/clients/{client_ids[0]}',
+                                      headers=dict(HEADERS, **{'If-None-Match': profile.headers['ETag']}))
+        self.assertEqual(revalidated.status_code, 304)
+
+        stats = self.get(f'/programs/{program["id"]}/stats').get_json()
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual(stats['by_gender'], {'Female': 2, 'Male': 1})
+        self.assertEqual(self.get('/programs/search', q='tuber').get_json()[0]['id'], other['id'])
+
+        changes = self.get('/changes', limit=1000).get_json()['changes']
+        self.assertEqual([c['entity'] for c in changes].count('enrollment'), 4)
+
+class MemoryStoreRoutesTest(StoreRoutesTest):
+    def make_app(self, **overrides):
+        return make_test_app(self, base=MemoryConfig, **overrides)
+
+    def test_snapshot_round_trip(self):
+        program, other, client_ids = self.populate()
+        path = os.path.join(self.app.workdir, 'store.bin')
+        store = self.app.extensions['his_store']
+        self.assertEqual(store.snapshot(path), store.writes)
+        with open(path, 'rb') as f:
+            snapshot = f.read()
+        for value in ('Achieng', 'Otieno', 'Wanjiku', '1985-03-02'):
+            self.assertNotIn(value.encode(), snapshot)
+
+        restored_app = self.make_app(MEMORY_SNAPSHOT_PATH=path, MEMORY_SNAPSHOT_INTERVAL=0)
+        self.addCleanup(restored_app.extensions['his_snapshotter'].stop)
+        restored = restored_app.test_client()
+        for path_args in (('/clients', {}), ('/clients/search', {'name': 'otieno'}), ('/programs/stats', {}),
+                          ('/changes', {'limit': 1000}), (f'/clients/{client_ids[0]}', {})):
+            path, args = path_args
+            expected = self.get(path, **args).get_json()
+            self.assertEqual(restored.get(path, query_string=args, headers=HEADERS).get_json(), expected)
+
+        # The restored store keeps taking writes
+        new_client = restored.post('/clients', json=CLIENTS[0], headers=HEADERS).get_json()
+        response = restored.post(f'/programs/{other["id"]}/enroll',
+                                 json={'client_ids': [new_client['id'], client_ids[1]]}, headers=HEADERS)
+        self.assertEqual(response.get_json()['enrolled'], 2)
+        self.assertEqual(len(restored.get('/clients/search', query_string={'name': 'achieng'},
+                                          headers=HEADERS).get_json()), 2)
+
+    def test_snapshot_during_writes_is_consistent(self):
+        program, other, _ = self.populate()
+        store = self.app.extensions['his_store']
+        path = os.path.join(self.app.workdir, 'store.bin')
+        stop = threading.Event()
+
+        def write():
+            while not stop.is_set():
+                ids = store.register_clients(CLIENTS * 50)
+                store.enroll_clients(program['id'], ids[::2])
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            writes = [store.snapshot(path) for _ in range(5)][-1]
+        finally:
+            stop.set()
+            writer.join()
+
+        restored = MemoryStore.restore(path)
+        self.assertEqual(restored.writes, writes)
+        clients = restored.client_count
+        self.assertEqual(list(restored.change_entities).count(0), clients)
+        self.assertEqual(sorted(restored._order), list(range(clients)))
+        self.assertTrue(all(max(postings) < clients for postings in restored.tokens.values() if postings))
+        enrolled = restored.program_stats(program['id'])['total']
+        self.assertEqual(enrolled, sum(1 for edge in restored.edge_program if edge == 0))
+        self.assertEqual(len(restored.client_page('grace', None, 1000)[0]), clients // 3)
+
+if __name__ == '__main__':
+    unittest.main()
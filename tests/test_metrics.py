@@ -0,0 +1,35 @@
+import unittest
+
+from support import HEADERS, make_test_app
+
+class RequestMetricsTest(unittest.TestCase):
+    def make_client(self, **overrides):
+        app = make_test_app(self, **overrides)
+
+        @app.route('/fail')
+        def fail():
+            raise RuntimeError('boom')
+
+        return app.test_client()
+
+    def request_count(self, client, endpoint):
+        # Counters are per process, so tests compare before and after
+        text = client.get('/metrics', headers=HEADERS).get_data(as_text=True)
+        prefix = f'his_request_duration_seconds_count{{endpoint="{endpoint}"}} '
+        return next((int(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)), 0)
+
+    def test_server_errors_are_recorded(self):
+        client = self.make_client()
+        before = self.request_count(client, 'fail')
+        self.assertEqual(client.get('/fail').status_code, 500)
+        self.assertEqual(self.request_count(client, 'fail'), before + 1)
+
+    def test_propagated_exceptions_are_recorded(self):
+        client = self.make_client(PROPAGATE_EXCEPTIONS=True)
+        before = self.request_count(client, 'fail')
+        with self.assertRaises(RuntimeError):
+            client.get('/fail')
+        self.assertEqual(self.request_count(client, 'fail'), before + 1)
+
+if __name__ == '__main__':
+    unittest.main()
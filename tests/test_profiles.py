@@ -0,0 +1,50 @@
+import threading
+import unittest
+from unittest import mock
+
+from support import HEADERS, make_test_app
+import profiles
+from profile_cache import profile_cache
+
+class ProfileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = make_test_app(self)
+        self.client = self.app.test_client()
+        self.client_id = self.post('/clients', {'name': 'Jane Doe', 'date_of_birth': '1990-01-01',
+                                                'gender': 'Female'})['id']
+        self.first, self.second = (
+            self.post('/programs', {'name': name, 'description': f'{name} care'})['id'] for name in ('HIV', 'TB')
+        )
+
+    def post(self, path, body):
+        response = self.app.test_client().post(path, json=body, headers=HEADERS)
+        self.assertLess(response.status_code, 300, response.get_json())
+        return response.get_json()
+
+    def enrolled(self):
+        response = self.client.get(f'/clients/{self.client_id}', headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        return {program['id'] for program in response.get_json()['enrolled_programs']}
+
+    def test_write_between_load_and_cache_leaves_no_stale_entry(self):
+        self.post(f'/clients/{self.client_id}/enroll', {'program_ids': [self.first]})
+        load_profiles = profiles.load_profiles
+
+        def load_then_write(client_ids):
+            loaded = load_profiles(client_ids)
+            # Commits and invalidates after the load, before the loaded profile is cached
+            writer = threading.Thread(
+                target=self.post, args=(f'/clients/{self.client_id}/enroll', {'program_ids': [self.second]})
+            )
+            writer.start()
+            writer.join()
+            return loaded
+
+        with mock.patch.object(profiles, 'load_profiles', side_effect=load_then_write):
+            self.assertEqual(self.enrolled(), {self.first})
+
+        self.assertIsNone(profile_cache.get(self.client_id))
+        self.assertEqual(self.enrolled(), {self.first, self.second})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from sqlalchemy import delete
+
+from support import HEADERS, make_test_app
+from changes import record_changes
+from models import db, Program
+
+class ProgramSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.app = make_test_app(self)
+        self.client = self.app.test_client()
+
+    def search(self, query):
+        response = self.client.get('/programs/search', query_string={'q': query}, headers=HEADERS)
+        self.assertEqual(response.status_code, 200)
+        return [program['name'] for program in response.get_json()]
+
+    def test_created_program_is_searchable(self):
+        self.assertEqual(self.search('malaria'), [])
+
+        response = self.client.post('/programs', json={'name': 'Malaria', 'description': 'Malaria treatment'},
+                                    headers=HEADERS)
+        self.assertEqual(response.status_code, 201)
+
+        # The empty result cached above must not hide the new program
+        self.assertEqual(self.search('malaria'), ['Malaria'])
+
+    def create(self, name):
+        response = self.client.post('/programs', json={'name': name, 'description': f'{name} care'},
+                                    headers=HEADERS)
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['id']
+
+    def test_delete_and_create_refreshes_search(self):
+        program_id = self.create('TB')
+        self.assertEqual(self.search('malaria'), [])
+
+        # The number of programs is unchanged, but the catalogue is not
+        with self.app.app_context():
+            db.session.execute(delete(Program).where(Program.id == program_id))
+            record_changes('program', 'delete', [program_id])
+            db.session.commit()
+        self.create('Malaria')
+        self.assertEqual(self.search('malaria'), ['Malaria'])
+
+if __name__ == '__main__':
+    unittest.main()
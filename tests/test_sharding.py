@@ -0,0 +1,79 @@
+import threading
+import time
+import unittest
+
+from support import HEADERS, make_test_app
+from config import SQLiteProductionConfig
+
+SHARD_COUNT = 4
+
+class ShardedWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.app = make_test_app(self, SQLiteProductionConfig, SHARD_COUNT=SHARD_COUNT)
+
+    def post_many(self, jobs):
+        """Run each (path, bodies) job on its own thread; returns every status code."""
+        statuses = []
+        lock = threading.Lock()
+
+        def worker(path, bodies):
+            client = self.app.test_client()
+            for body in bodies:
+                status = client.post(path, json=body, headers=HEADERS).status_code
+                with lock:
+                    statuses.append(status)
+
+        threads = [threading.Thread(target=worker, args=job) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_concurrent_registrations_and_program_creation(self):
+        client = {'name': 'Jane Doe', 'date_of_birth': '1990-01-01', 'gender': 'Female'}
+        program = {'name': 'TB', 'description': 'Tuberculosis treatment'}
+        jobs = [('/clients', [client] * 5)] * 8 + [('/programs', [program] * 5)] * 4
+
+        start = time.monotonic()
+        statuses = self.post_many(jobs)
+        # Crossed lock order used to stall on the 30 s busy timeout and fail
+        self.assertLess(time.monotonic() - start, 20)
+        self.assertEqual(statuses, [201] * 60)
+
+        client = self.app.test_client()
+        self.assertEqual(len(client.get('/programs', headers=HEADERS).get_json()), 20)
+        changes, cursor = [], 0
+        while True:
+            page = client.get('/changes', query_string={'since': cursor, 'limit': 1000}, headers=HEADERS).get_json()
+            if not page['changes']:
+                break
+            changes.extend(page['changes'])
+            cursor = page['next']
+        self.assertEqual(len(changes), 60)
+        self.assertEqual({change['shard'] for change in changes if change['entity'] == 'program'}, {0})
+
+    def test_program_stats_merge_shards(self):
+        program_id = self.app.test_client().post(
+            '/programs', json={'name': 'HIV', 'description': 'HIV care'}, headers=HEADERS
+        ).get_json()['id']
+        client = self.app.test_client()
+        client_ids = [
+            client.post('/clients', json={'name': f'Client {i}', 'date_of_birth': '1985-05-05', 'gender': 'Male'},
+                        headers=HEADERS).get_json()['id']
+            for i in range(20)
+        ]
+        response = client.post(f'/programs/{program_id}/enroll', json={'client_ids': client_ids}, headers=HEADERS)
+        self.assertEqual(response.get_json()['enrolled'], 20)
+        stats = client.get(f'/programs/{program_id}/stats', headers=HEADERS).get_json()
+        self.assertEqual(stats['total'], 20)
+        self.assertEqual(stats['breakdown'], [{'gender': 'Male', 'birth_decade': '1980', 'count': 20}])
+
+class ShardedBatchedWriteTest(ShardedWriteTest):
+    """The same writes through group commit, which commits each shard's jobs on their own."""
+
+    def setUp(self):
+        self.app = make_test_app(self, SQLiteProductionConfig, SHARD_COUNT=SHARD_COUNT, WRITE_BATCH_SIZE=16)
+
+if __name__ == '__main__':
+    unittest.main()